@@ -56,7 +56,7 @@ async def add_turkish_content():
             "saves_count": 5 + i * 3,
             "views_count": 50 + i * 20,
             "shares_count": 0,
-            "created_at": (datetime.now(timezone.utc) - timedelta(days=5 - i)).isoformat()
+            "created_at": (datetime.now(timezone.utc) - timedelta(days=5 - i))
         }
         await db.quotes.insert_one(quote)
         
@@ -132,8 +132,8 @@ Hayalleriniz gerçekleşebilir!""",
             "language": "tr",
             "country": "Turkey",
             "published": True,
-            "created_at": (datetime.now(timezone.utc) - timedelta(days=10 - i*5)).isoformat(),
-            "updated_at": (datetime.now(timezone.utc) - timedelta(days=10 - i*5)).isoformat()
+            "created_at": (datetime.now(timezone.utc) - timedelta(days=10 - i*5)),
+            "updated_at": (datetime.now(timezone.utc) - timedelta(days=10 - i*5))
         }
         await db.blogs.insert_one(blog)
     
@@ -0,0 +1,123 @@
+"""
+Micro-benchmark of response serialization.
+
+Compares FastAPI's default path (`jsonable_encoder` then `JSONResponse`,
+building a `UserProfile` per user row) with the fast path (`projector` then
+orjson) on payloads shaped like the heaviest read routes. Nothing is read from
+the database, but importing server for the models needs its .env settings.
+
+    python bench_json.py [iterations]
+"""
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from fastjson import FastJSONResponse, projector
+from server import UserProfile
+
+user_profile = projector(UserProfile)
+
+
+def quote_row(i: int, now: datetime) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "content": f"Quote {i}: the only way to do great work is to love what you do.",
+        "author": "Steve Jobs",
+        "category_id": str(uuid.uuid4()),
+        "tags": ["inspiration", "work", "life"],
+        "language": "en",
+        "likes_count": i % 97,
+        "saves_count": i % 31,
+        "views_count": i * 7,
+        "created_at": now - timedelta(minutes=i),
+    }
+
+
+def user_row(i: int, now: datetime) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "username": f"@user{i}",
+        "email": f"user{i}@example.com",
+        "password_hash": "$2b$12$" + "x" * 53,
+        "first_name": "Ada",
+        "last_name": "Lovelace",
+        "full_name": "Ada Lovelace",
+        "bio": "Writes about engines and poetry.",
+        "avatar": f"/uploads/avatars/{uuid.uuid4().hex}.jpg",
+        "country": "GB",
+        "language": "en",
+        "social_links": {"twitter": f"user{i}"},
+        "followers_count": i * 3,
+        "following_count": i,
+        "quotes_count": i % 50,
+        "score": i * 11,
+        "is_admin": False,
+        "created_at": now - timedelta(days=i),
+    }
+
+
+def blog_row(i: int, now: datetime) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "title": f"Post {i}",
+        "slug": f"post-{i}",
+        "content": "<p>" + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 80 + "</p>",
+        "excerpt": "Lorem ipsum dolor sit amet.",
+        "featured_image": None,
+        "language": "en",
+        "country": None,
+        "published": True,
+        "created_at": now - timedelta(days=i),
+        "updated_at": now - timedelta(days=i),
+    }
+
+
+def default_path(payload, users: bool) -> bytes:
+    if users:
+        payload = [{**r, "user": UserProfile(**r["user"])} for r in payload]
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def fast_path(payload, users: bool) -> bytes:
+    if users:
+        payload = [{**r, "user": user_profile(r["user"])} for r in payload]
+    return FastJSONResponse(payload).body
+
+
+def normalized(body: bytes):
+    # Pydantic writes UTC as "Z", orjson and jsonable_encoder as "+00:00"
+    return json.loads(body.decode().replace('Z"', '+00:00"'))
+
+
+def timed(fn, payload, users: bool, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(payload, users)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main(iterations: int):
+    now = datetime.now(timezone.utc).replace(microsecond=123000)
+    payloads = [
+        ("/users/{id}/quotes (1000 quotes)", [quote_row(i, now) for i in range(1000)], False),
+        ("/blogs (20 posts)", [blog_row(i, now) for i in range(20)], False),
+        ("/ranking (50 users)", [{"user": user_row(i, now), "score": 50 - i, "quotes": i} for i in range(50)], True),
+    ]
+    print(f"{'payload':36} {'default ms':>11} {'fast ms':>9} {'speedup':>8} {'bytes':>9}")
+    for name, payload, users in payloads:
+        # Both paths must produce the same document
+        assert normalized(default_path(payload, users)) == normalized(fast_path(payload, users)), name
+        default_ms = timed(default_path, payload, users, iterations)
+        fast_ms = timed(fast_path, payload, users, iterations)
+        size = len(fast_path(payload, users))
+        print(f"{name:36} {default_ms:11.3f} {fast_ms:9.3f} {default_ms / fast_ms:7.1f}x {size:9d}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
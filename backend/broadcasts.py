@@ -0,0 +1,141 @@
+"""
+Broadcast notifications, stored once and fanned out on read.
+
+A broadcast is a single document in `broadcasts`; each user's interaction with
+it is a marker in `broadcast_reads` ({user_id, broadcast_id, read, dismissed})
+written only when they read or dismiss it. A user sees the broadcasts created
+after they registered, merged into their personal notification feed.
+
+The only per-user work left is bumping unread badge counters. That runs as a
+background job, streaming users in batches and recording its progress on the
+broadcast, and resumes from the last batch if the job is retried. Counting
+moves each user's broadcast watermark (see `unread.count_broadcasts`), so a
+batch repeated after a crash is not counted twice.
+"""
+import logging
+import os
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+import unread
+
+logger = logging.getLogger(__name__)
+
+FAN_OUT_BATCH_SIZE = int(os.environ.get('BROADCAST_BATCH_SIZE', 1000))
+
+
+def as_notification(broadcast: dict, user_id: str, marker: dict = None) -> dict:
+    return {
+        "id": broadcast["id"],
+        "user_id": user_id,
+        "type": broadcast["type"],
+        "title": broadcast["title"],
+        "message": broadcast["message"],
+        "link": broadcast.get("link"),
+        "read": bool(marker and marker.get("read")),
+        "created_at": broadcast["created_at"],
+        "broadcast": True,
+    }
+
+
+async def visible_to(db, user_id: str, registered_at, limit: int = 50) -> list:
+    """Broadcasts the user has not dismissed, newest first, as notification documents."""
+    broadcasts = await db.broadcasts.find(
+        {"created_at": {"$gt": registered_at}},
+        {"_id": 0, "fanout": 0}
+    ).sort("created_at", -1).limit(limit).to_list(limit)
+    if not broadcasts:
+        return []
+    markers = await db.broadcast_reads.find(
+        {"user_id": user_id, "broadcast_id": {"$in": [b["id"] for b in broadcasts]}},
+        {"_id": 0}
+    ).to_list(len(broadcasts))
+    by_id = {m["broadcast_id"]: m for m in markers}
+    return [
+        as_notification(b, user_id, by_id.get(b["id"]))
+        for b in broadcasts if not by_id.get(b["id"], {}).get("dismissed")
+    ]
+
+
+async def set_marker(db, user_id: str, broadcast_id: str, **fields) -> bool:
+    """Mark the broadcast read (plus `fields`) and settle its badge; False if it doesn't exist."""
+    broadcast = await db.broadcasts.find_one({"id": broadcast_id}, {"_id": 0, "created_at": 1})
+    if not broadcast:
+        return False
+    previous = await db.broadcast_reads.find_one_and_update(
+        {"user_id": user_id, "broadcast_id": broadcast_id},
+        {"$set": {**fields, "read": True}},
+        projection={"_id": 0, "read": 1},
+        upsert=True
+    )
+    if not (previous and previous.get("read")):
+        await unread.settle_broadcasts(db, user_id, [broadcast["created_at"]])
+    return True
+
+
+async def mark_all_read(db, user_id: str, registered_at) -> int:
+    """Mark every visible broadcast read and settle the badges; returns how many were newly read."""
+    created = {
+        b["id"]: b["created_at"]
+        async for b in db.broadcasts.find({"created_at": {"$gt": registered_at}}, {"_id": 0, "id": 1, "created_at": 1})
+    }
+    if not created:
+        return 0
+    already = set(await db.broadcast_reads.distinct(
+        "broadcast_id", {"user_id": user_id, "broadcast_id": {"$in": list(created)}, "read": True}
+    ))
+    pending = [i for i in created if i not in already]
+    if not pending:
+        return 0
+    try:
+        await db.broadcast_reads.bulk_write([
+            UpdateOne({"user_id": user_id, "broadcast_id": i, "read": {"$ne": True}}, {"$set": {"read": True}}, upsert=True)
+            for i in pending
+        ], ordered=False)
+    except BulkWriteError as e:
+        # A collision means a concurrent request read that one first and settled it
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+        collided = {pending[error["index"]] for error in e.details["writeErrors"]}
+        pending = [i for i in pending if i not in collided]
+    await unread.settle_broadcasts(db, user_id, [created[i] for i in pending])
+    return len(pending)
+
+
+async def remove_user(db, user_id: str):
+    await db.broadcast_reads.delete_many({"user_id": user_id})
+
+
+async def fan_out(db, job: dict, progress):
+    broadcast_id = job["params"]["broadcast_id"]
+    broadcast = await db.broadcasts.find_one({"id": broadcast_id}, {"_id": 0})
+    if broadcast is None:
+        return
+    state = broadcast.get("fanout") or {}
+    last_id = state.get("last_user_oid")
+    processed = state.get("processed", 0)
+    query = {"created_at": {"$lt": broadcast["created_at"]}}
+    if "total" not in state:
+        state["total"] = await db.users.count_documents(query)
+        await db.broadcasts.update_one({"id": broadcast_id}, {"$set": {"fanout.total": state["total"]}})
+
+    while True:
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        users = await db.users.find(query, {"_id": 1, "id": 1, "created_at": 1}).sort("_id", 1) \
+            .limit(FAN_OUT_BATCH_SIZE).to_list(FAN_OUT_BATCH_SIZE)
+        if not users:
+            break
+        # Users who read it before their batch came up are not counted for it
+        await unread.count_broadcasts(db, users, broadcast["created_at"])
+        last_id = users[-1]["_id"]
+        processed += len(users)
+        await db.broadcasts.update_one(
+            {"id": broadcast_id},
+            {"$set": {"fanout.processed": processed, "fanout.last_user_oid": last_id}}
+        )
+        await progress(processed=processed, total=state["total"])
+
+    await db.broadcasts.update_one({"id": broadcast_id}, {"$set": {"fanout.status": "done"}})
+    logger.info("Broadcast %s fanned out to %d users", broadcast_id, processed)
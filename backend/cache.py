@@ -0,0 +1,121 @@
+"""
+Small in-process caches shared by the API.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class LoadingCache(TTLCache):
+    """TTLCache that builds missing entries itself, one build per key at a time."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        # key -> [lock, requests holding or waiting for it]; dropped when the last one leaves
+        self._locks = {}
+        self._generation = 0
+        self.builds = 0
+        self.build_seconds_total = 0.0
+        self.build_seconds_max = 0.0
+        self.last_build_seconds = 0.0
+
+    async def get_or_build(self, key, build):
+        value = self.get(key)
+        if value is not None:
+            return value
+        holder = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        holder[1] += 1
+        try:
+            async with holder[0]:
+                return await self._build(key, build)
+        finally:
+            holder[1] -= 1
+            if holder[1] == 0:
+                del self._locks[key]
+
+    async def _build(self, key, build):
+        # Another request may have rebuilt it while we waited
+        entry = self._data.get(key)
+        if entry is not None and entry[1] >= time.monotonic():
+            return entry[0]
+        generation = self._generation
+        started = time.perf_counter()
+        value = await build()
+        elapsed = time.perf_counter() - started
+        self.builds += 1
+        self.build_seconds_total += elapsed
+        self.build_seconds_max = max(self.build_seconds_max, elapsed)
+        self.last_build_seconds = elapsed
+        # Don't keep a value that was invalidated while it was being built
+        if generation == self._generation:
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        self._generation += 1
+        super().invalidate(key)
+
+    def clear(self):
+        self._generation += 1
+        super().clear()
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update({
+            "builds": self.builds,
+            "build_seconds_avg": round(self.build_seconds_total / self.builds, 6) if self.builds else 0.0,
+            "build_seconds_max": round(self.build_seconds_max, 6),
+            "last_build_seconds": round(self.last_build_seconds, 6),
+        })
+        return stats
@@ -0,0 +1,144 @@
+"""
+Cascading deletes run by the job worker.
+
+The route removes the user or quote document itself; these handlers clean
+up everything that referenced it in batches and correct the counters the
+removed rows contributed to. Each batch deletes its rows before adjusting
+counters, so a re-run after a crash never applies the same correction twice;
+at worst a counter is left high, which the reconcile pass repairs.
+"""
+from collections import Counter
+
+from pymongo import UpdateOne
+
+import broadcasts
+import leaderboard
+import trending
+import unread
+from quote_search import unindex_user
+from reconcile import counter_update
+
+BATCH_SIZE = 1000
+
+
+async def _batches(collection, query: dict, projection: dict, batch_size: int = BATCH_SIZE):
+    """Yield batches of matching rows, deleting each batch before it is handed out."""
+    while True:
+        rows = await collection.find(query, {**projection, "_id": 1}).limit(batch_size).to_list(batch_size)
+        if not rows:
+            return
+        await collection.delete_many({"_id": {"$in": [r["_id"] for r in rows]}})
+        yield rows
+
+
+async def _remove_reactions(db, collection: str, user_id: str, progress):
+    """Delete a user's likes or saves and take them off the quotes' counters."""
+    counter_field, bucket_field = {"likes": ("likes_count", "likes"), "saves": ("saves_count", "saves")}[collection]
+    removed = 0
+    async for rows in _batches(db[collection], {"user_id": user_id}, {"quote_id": 1}):
+        per_quote = Counter(r["quote_id"] for r in rows)
+        quotes = await db.quotes.find(
+            {"id": {"$in": list(per_quote)}, "user_id": {"$ne": user_id}},
+            {"_id": 0, "id": 1, "user_id": 1, "created_at": 1}
+        ).to_list(len(per_quote))
+        if quotes:
+            await db.quotes.bulk_write([
+                UpdateOne({"id": q["id"]}, counter_update(**{counter_field: -per_quote[q["id"]]})) for q in quotes
+            ], ordered=False)
+            await db[leaderboard.COLLECTION].bulk_write([
+                leaderboard.bucket_update(q["user_id"], q["created_at"], **{bucket_field: -per_quote[q["id"]]})
+                for q in quotes
+            ], ordered=False)
+        removed += len(rows)
+        await progress(**{collection: removed})
+
+
+async def _remove_follows(db, user_id: str, progress):
+    removed = 0
+    # Users this one followed lose a follower; their followers lose a followee
+    for own_field, other_field, counter in (
+        ("follower_id", "following_id", "followers_count"),
+        ("following_id", "follower_id", "following_count"),
+    ):
+        async for rows in _batches(db.follows, {own_field: user_id}, {other_field: 1}):
+            per_user = Counter(r[other_field] for r in rows)
+            await db.users.bulk_write([
+                UpdateOne({"id": uid}, counter_update(**{counter: -count})) for uid, count in per_user.items()
+            ], ordered=False)
+            removed += len(rows)
+            await progress(follows=removed)
+
+
+async def _remove_quotes(db, user_id: str, progress):
+    removed = 0
+    async for quotes in _batches(db.quotes, {"user_id": user_id}, {"id": 1, "category_id": 1}):
+        ids = [q["id"] for q in quotes]
+        await db.likes.delete_many({"quote_id": {"$in": ids}})
+        await db.saves.delete_many({"quote_id": {"$in": ids}})
+        await trending.remove_quotes(db, ids)
+        per_category = Counter(q.get("category_id") for q in quotes if q.get("category_id"))
+        if per_category:
+            await db.categories.bulk_write([
+                UpdateOne({"id": cid}, counter_update(quotes_count=-count)) for cid, count in per_category.items()
+            ], ordered=False)
+        removed += len(quotes)
+        await progress(quotes=removed)
+
+
+async def _remove_conversations(db, user_id: str, progress):
+    removed = 0
+    async for rows in _batches(db.conversations, {"participants": user_id}, {"unread": 1}):
+        # Partners lose the unread messages of the conversations that go away
+        for conversation in rows:
+            for uid, count in (conversation.get("unread") or {}).items():
+                if uid != user_id:
+                    await unread.decrement(db, uid, "messages", count)
+        removed += len(rows)
+        await progress(conversations=removed)
+
+    removed = 0
+    query = {"$or": [{"sender_id": user_id}, {"receiver_id": user_id}]}
+    async for rows in _batches(db.messages, query, {"id": 1}):
+        removed += len(rows)
+        await progress(messages=removed)
+
+
+async def delete_user(db, job: dict, progress):
+    user_id = job["params"]["user_id"]
+    await _remove_reactions(db, "likes", user_id, progress)
+    await _remove_reactions(db, "saves", user_id, progress)
+    await _remove_follows(db, user_id, progress)
+    await _remove_quotes(db, user_id, progress)
+    await _remove_conversations(db, user_id, progress)
+    await db.notifications.delete_many({"user_id": user_id})
+    await unread.remove_user(db, user_id)
+    await broadcasts.remove_user(db, user_id)
+    await leaderboard.remove_user(db, user_id)
+    await unindex_user(db, user_id)
+
+
+async def delete_quote(db, job: dict, progress):
+    """Clean up after a deleted quote; the job params carry the removed document."""
+    quote = job["params"]["quote"]
+    # Applied at most once: the flag is recorded on the job before the corrections, so a
+    # retry after a crash skips them and reconcile repairs anything left high
+    if not job["progress"].get("counters_applied"):
+        await progress(counters_applied=True)
+        await db.users.update_one({"id": quote["user_id"]}, counter_update(quotes_count=-1))
+        if quote.get("category_id"):
+            await db.categories.update_one({"id": quote["category_id"]}, counter_update(quotes_count=-1))
+        await leaderboard.record(
+            db, quote["user_id"], quote["created_at"],
+            quotes=-1,
+            views=-quote.get("views_count", 0),
+            likes=-quote.get("likes_count", 0),
+            saves=-quote.get("saves_count", 0)
+        )
+        await trending.remove_quotes(db, [quote["id"]])
+
+    # Reactions on the quote only fed its own counters, which are gone with it
+    removed = 0
+    for collection in ("likes", "saves"):
+        async for rows in _batches(db[collection], {"quote_id": quote["id"]}, {"id": 1}):
+            removed += len(rows)
+            await progress(reactions=removed)
@@ -0,0 +1,124 @@
+"""
+In-memory index of the categories collection.
+
+Categories are few and rarely edited, so the whole collection is held in
+memory, indexed by id, slug and parent, and the category routes never query
+Mongo. The index is loaded at startup and reloaded after an admin creates or
+edits a category (announced on the broker so every worker reloads) and every
+`refresh_interval`, which is what picks up `quotes_count` changes.
+
+The localized tree for /api/categories/tree is serialized once per language
+and version and reused until the next reload.
+"""
+import asyncio
+import logging
+
+from fastjson import dumps
+
+logger = logging.getLogger(__name__)
+
+
+def _name_key(category: dict):
+    return category.get("name") or ""
+
+
+class CategoryIndex:
+    TOPIC = "categories"
+
+    def __init__(self, db, refresh_interval: float = 60.0):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.by_id = {}
+        self.by_slug = {}
+        self.children_of = {}
+        self.languages = set()
+        self.version = 0
+        self._trees = {}
+        self._lock = asyncio.Lock()
+        self._task = None
+        self.loads = 0
+        self.tree_builds = 0
+
+    async def load(self):
+        async with self._lock:
+            docs = await self.db.categories.find({}, {"_id": 0}).to_list(None)
+            by_id = {c["id"]: c for c in docs}
+            children_of = {}
+            for c in sorted(docs, key=_name_key):
+                # A category whose parent is gone is shown at the top level
+                parent = c.get("parent_id") if c.get("parent_id") in by_id else None
+                children_of.setdefault(parent, []).append(c)
+            self.by_id = by_id
+            self.by_slug = {c["slug"]: c for c in docs if c.get("slug")}
+            self.children_of = children_of
+            self.languages = {lang for c in docs for lang in (c.get("translations") or {})}
+            self._trees = {}
+            self.version += 1
+            self.loads += 1
+
+    def get(self, category_id: str):
+        return self.by_id.get(category_id)
+
+    def children(self, parent_id: str = None) -> list:
+        """Direct children of `parent_id` (top level for None), by name."""
+        if parent_id is None:
+            return [c for c in self.children_of.get(None, []) if c.get("parent_id") is None]
+        return self.children_of.get(parent_id, [])
+
+    def top(self, limit: int) -> list:
+        return sorted(self.by_id.values(), key=lambda c: c.get("quotes_count", 0), reverse=True)[:limit]
+
+    def _localized(self, category: dict, language: str) -> dict:
+        translation = (category.get("translations") or {}).get(language) or {}
+        return {
+            "id": category["id"],
+            "slug": category.get("slug"),
+            "name": translation.get("name") or category.get("name"),
+            "description": translation.get("description") or category.get("description"),
+            "icon": category.get("icon"),
+            "parent_id": category.get("parent_id"),
+            "quotes_count": category.get("quotes_count", 0),
+            "children": [self._localized(child, language) for child in self.children_of.get(category["id"], [])],
+        }
+
+    def tree(self, language: str = None) -> bytes:
+        """The whole hierarchy localized to `language`, as serialized JSON."""
+        # Languages no category is translated into share the untranslated tree
+        if language not in self.languages:
+            language = None
+        body = self._trees.get(language)
+        if body is None:
+            body = dumps([self._localized(c, language) for c in self.children_of.get(None, [])])
+            self._trees[language] = body
+            self.tree_builds += 1
+        return body
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.load()
+            except Exception:
+                logger.exception("Reloading the category index failed")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "categories": len(self.by_id),
+            "version": self.version,
+            "loads": self.loads,
+            "cached_trees": len(self._trees),
+            "tree_builds": self.tree_builds,
+        }
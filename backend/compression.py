@@ -0,0 +1,223 @@
+"""
+Response compression.
+
+Pure ASGI middleware that compresses JSON and text responses with the best
+encoding the client accepts: zstd, then brotli, then gzip. zstd and brotli are
+only offered when the `zstandard` / `brotli` packages are installed.
+
+Complete responses smaller than `minimum_size` are sent as they are; streamed
+responses are compressed chunk by chunk and flushed after every chunk so the
+client isn't kept waiting. Bytes before and after compression are recorded per
+route template (or mount prefix) for /api/admin/metrics.
+"""
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Stats key for requests no route matched (404s)
+UNMATCHED = "<unmatched>"
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/x-ndjson",
+    "application/xml",
+    "image/svg+xml",
+}
+
+
+class GzipEncoder:
+    def __init__(self, level: int = 6):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self, quality: int = 4):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int = 3):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+def available_encoders() -> dict:
+    """Encoding name -> encoder class, in order of preference."""
+    encoders = {}
+    if zstandard is not None:
+        encoders["zstd"] = ZstdEncoder
+    if brotli is not None:
+        encoders["br"] = BrotliEncoder
+    encoders["gzip"] = GzipEncoder
+    return encoders
+
+
+def negotiate(accept_encoding: str, encoders: dict):
+    """Pick the preferred encoding the client accepts with the highest q-value."""
+    weights = {}
+    for item in accept_encoding.lower().split(","):
+        coding, *params = [p.strip() for p in item.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            weights[coding] = q
+    best, best_q = None, 0.0
+    for coding in encoders:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";")[0].strip().lower()
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES or media_type.endswith("+json")
+
+
+class CompressionStats:
+    def __init__(self):
+        self.routes = {}
+
+    def record(self, route: str, encoding, bytes_in: int, bytes_out: int):
+        entry = self.routes.setdefault(route, {"responses": 0, "compressed": 0, "bytes_in": 0, "bytes_out": 0})
+        entry["responses"] += 1
+        if encoding:
+            entry["compressed"] += 1
+        entry["bytes_in"] += bytes_in
+        entry["bytes_out"] += bytes_out
+
+    def stats(self, top: int = 20) -> dict:
+        routes = sorted(self.routes.items(), key=lambda item: item[1]["bytes_out"] - item[1]["bytes_in"])
+        bytes_in = sum(e["bytes_in"] for e in self.routes.values())
+        bytes_out = sum(e["bytes_out"] for e in self.routes.values())
+        return {
+            "encodings": list(available_encoders()),
+            "bytes_in": bytes_in,
+            "bytes_out": bytes_out,
+            "bytes_saved": bytes_in - bytes_out,
+            "routes": {
+                route: {**e, "bytes_saved": e["bytes_in"] - e["bytes_out"]} for route, e in routes[:top]
+            },
+        }
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, stats: CompressionStats = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.stats = stats
+        self.encoders = available_encoders()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.encoders)
+        if encoding is None and self.stats is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressingResponder(self, scope, send, encoding)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressingResponder:
+    def __init__(self, middleware: CompressionMiddleware, scope: Scope, send: Send, encoding):
+        self.middleware = middleware
+        self.scope = scope
+        # Routing extends root_path in place when the request enters a mount
+        self.root_path = scope.get("root_path", "")
+        self._send = send
+        self.encoding = encoding
+        self.encoder = None
+        self.start_message = None
+        self.passthrough = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self.start_message = message
+            self.passthrough = (
+                self.encoding is None
+                or message["status"] in (204, 206, 304)
+                or "content-encoding" in headers
+                or not is_compressible(headers.get("content-type", ""))
+            )
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        self.bytes_in += len(body)
+
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            if not self.passthrough and not more_body and len(body) < self.middleware.minimum_size:
+                self.passthrough = True
+            if not self.passthrough:
+                headers = MutableHeaders(raw=start["headers"])
+                headers["content-encoding"] = self.encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["content-length"]
+                self.encoder = self.middleware.encoders[self.encoding]()
+                if not more_body:
+                    # The whole body is here: compress it up front so Content-Length can still be sent
+                    body = self.encoder.finish(body)
+                    headers["content-length"] = str(len(body))
+                    self.encoder = None
+            await self._send(start)
+
+        if self.encoder is not None:
+            body = self.encoder.compress(body) if more_body else self.encoder.finish(body)
+        self.bytes_out += len(body)
+        await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        if not more_body and self.middleware.stats is not None:
+            self.middleware.stats.record(self.route_name(), None if self.passthrough else self.encoding, self.bytes_in, self.bytes_out)
+
+    def route_name(self) -> str:
+        """The route template, or the mount prefix; never the raw path, which clients control."""
+        route = self.scope.get("route")
+        if getattr(route, "path", None):
+            return route.path
+        mount = self.scope.get("root_path", "")[len(self.root_path):]
+        return f"{mount}/*" if mount else UNMATCHED
@@ -0,0 +1,66 @@
+"""
+Direct message conversations.
+
+Every message carries the `conversation_id` of its two participants, and each
+conversation has one summary document in `conversations` (latest message,
+unread count and read high-water mark per participant). Reading only moves
+the reader's mark; whether a message has been read is derived from the mark
+of its receiver rather than stored on every message.
+"""
+from datetime import datetime
+
+import unread
+
+
+def conversation_key(user_a: str, user_b: str) -> str:
+    return ":".join(sorted([user_a, user_b]))
+
+
+async def mark_read(db, conversation_id: str, user_id: str, upto: datetime) -> int:
+    """Move the reader's mark to `upto`; returns how many unread messages it passed."""
+    # Bounded by the newest message the reader was shown, never ones that arrived since
+    previous = await db.conversations.find_one_and_update(
+        {"id": conversation_id},
+        {"$max": {f"last_read_at.{user_id}": upto}},
+        projection={"_id": 0, "last_read_at": 1, "unread": 1, "last_message": 1}
+    )
+    if previous is None:
+        return 0
+    old_mark = (previous.get("last_read_at") or {}).get(user_id)
+    if old_mark is not None and old_mark >= upto:
+        return 0
+
+    marked = 0
+    pending = (previous.get("unread") or {}).get(user_id, 0)
+    if pending > 0:
+        # Only the messages between the old mark and the new one, and never more than were unread
+        query = {"conversation_id": conversation_id, "created_at": {"$lte": upto}, "receiver_id": user_id}
+        if old_mark is not None:
+            query["created_at"]["$gt"] = old_mark
+        else:
+            # No mark yet: messages from before the conversations migration carry their own flag
+            query["read"] = {"$ne": True}
+        marked = await db.messages.count_documents(query, limit=pending)
+    update = {}
+    if marked:
+        update["$inc"] = {f"unread.{user_id}": -marked}
+    last_message = previous.get("last_message") or {}
+    sent = last_message.get("created_at")
+    if last_message.get("receiver_id") == user_id and sent is not None and sent <= upto:
+        update["$set"] = {"last_message.read": True}
+    if update:
+        await db.conversations.update_one({"id": conversation_id}, update)
+    await unread.decrement(db, user_id, "messages", marked)
+    return marked
+
+
+async def with_read_flags(db, messages: list) -> list:
+    """Set `read` on messages from their receivers' marks (or the legacy stored flag)."""
+    ids = list({m["conversation_id"] for m in messages if m.get("conversation_id")})
+    marks = {}
+    async for c in db.conversations.find({"id": {"$in": ids}}, {"_id": 0, "id": 1, "last_read_at": 1}):
+        marks[c["id"]] = c.get("last_read_at") or {}
+    for m in messages:
+        mark = marks.get(m.get("conversation_id"), {}).get(m["receiver_id"])
+        m["read"] = bool(m.get("read")) or (mark is not None and m["created_at"] <= mark)
+    return messages
@@ -0,0 +1,59 @@
+"""
+Fast JSON responses.
+
+FastAPI runs every returned value through `jsonable_encoder` before the
+response class serializes it, which walks the whole structure in Python. For
+rows read straight from Mongo that work is wasted: they already hold only
+JSON-friendly values. `respond` hands such content to orjson directly, and
+`projector` shapes trusted rows like a response model without building and
+validating a model instance per row.
+"""
+import orjson
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=OPTIONS)
+
+
+class FastJSONResponse(ORJSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def respond(content, status_code: int = 200) -> FastJSONResponse:
+    """Serialize trusted content as is, skipping FastAPI's encoder pass."""
+    return FastJSONResponse(content, status_code=status_code)
+
+
+def projector(model: type[BaseModel]):
+    """Compile a function that picks `model`'s fields from a trusted dict, filling defaults."""
+    _missing = object()
+    fields = []
+    for name, info in model.model_fields.items():
+        if info.default_factory is not None:
+            fields.append((name, None, info.default_factory))
+        else:
+            fields.append((name, None if info.is_required() else info.default, None))
+
+    def project(row: dict) -> dict:
+        out = {}
+        for name, default, factory in fields:
+            value = row.get(name, _missing)
+            if value is _missing:
+                value = factory() if factory is not None else default
+            out[name] = value
+        return out
+
+    return project
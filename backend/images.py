@@ -0,0 +1,158 @@
+"""
+Resized variants of uploaded images.
+
+Every upload gets a set of downscaled WebP and JPEG copies next to the
+original, named `<original stem>_<variant>.<ext>`, plus a full-size WebP.
+Resizing is CPU bound, so it runs in a process pool rather than on the event
+loop. The variant URLs are stored on the document that uses the image
+(`users.avatar_variants`, `backgrounds.variants`, `blogs.featured_image_variants`).
+Generate variants for images uploaded before this existed with:
+
+    python images.py backfill [--force]
+"""
+import asyncio
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from PIL import Image, ImageOps
+
+from uploads import UPLOAD_DIR
+
+# Longest side in pixels of each variant, per upload directory; None keeps the original size
+VARIANTS = {
+    "avatars": {"thumb": 64, "small": 160, "medium": 320, "full": None},
+    "backgrounds": {"small": 640, "large": 1920, "full": None},
+    "blogs": {"small": 640, "large": 1600, "full": None},
+}
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+_executor = None
+
+
+def render_variants(src: str, subdir: str) -> dict:
+    """Write the variants of one image and return their URLs and sizes. Runs in a worker process."""
+    src_path = Path(src)
+    stem = src_path.stem
+    variants = {}
+    with Image.open(src_path) as opened:
+        image = ImageOps.exif_transpose(opened)
+        image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+    for name, longest in VARIANTS[subdir].items():
+        resized = image.copy()
+        if longest is not None:
+            resized.thumbnail((longest, longest), Image.LANCZOS)
+        entry = {"width": resized.width, "height": resized.height}
+
+        webp_path = src_path.with_name(f"{stem}_{name}.webp")
+        if not webp_path.exists():
+            resized.save(webp_path, "WEBP", quality=WEBP_QUALITY, method=4)
+        entry["webp"] = f"/uploads/{subdir}/{webp_path.name}"
+
+        # The full-size variant only adds WebP; the original already covers other formats
+        if longest is not None:
+            jpeg_path = src_path.with_name(f"{stem}_{name}.jpg")
+            if not jpeg_path.exists():
+                flat = resized
+                if resized.mode == "RGBA":
+                    flat = Image.new("RGB", resized.size, (255, 255, 255))
+                    flat.paste(resized, mask=resized.getchannel("A"))
+                flat.save(jpeg_path, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+            entry["jpeg"] = f"/uploads/{subdir}/{jpeg_path.name}"
+
+        variants[name] = entry
+    return variants
+
+
+def upload_path(url: str):
+    """Map an /uploads URL to (path, subdir), or (None, None) if it isn't a local upload."""
+    if not url or not url.startswith("/uploads/"):
+        return None, None
+    parts = url[len("/uploads/"):].split("/")
+    if len(parts) != 2 or parts[0] not in VARIANTS or parts[1].startswith("."):
+        return None, None
+    return UPLOAD_DIR / parts[0] / parts[1], parts[0]
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=int(os.environ.get('IMAGE_WORKERS', 2)))
+    return _executor
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def generate(url: str):
+    """Create the variants of an uploaded image; returns None for URLs that aren't local uploads."""
+    path, subdir = upload_path(url)
+    if path is None or not path.exists():
+        return None
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_executor(), render_variants, str(path), subdir)
+    except (OSError, Image.DecompressionBombError):
+        raise HTTPException(status_code=400, detail="Image could not be decoded")
+
+
+async def backfill(db, force: bool = False):
+    """Generate and record variants for every referenced upload that lacks them."""
+    targets = [
+        ("users", "avatar", "avatar_variants"),
+        ("backgrounds", "url", "variants"),
+        ("blogs", "featured_image", "featured_image_variants"),
+    ]
+    totals = {}
+    for collection, field, variants_field in targets:
+        query = {field: {"$regex": "^/uploads/"}}
+        if not force:
+            query[variants_field] = None
+        done = 0
+        async for doc in db[collection].find(query, {"_id": 0, "id": 1, field: 1}):
+            try:
+                variants = await generate(doc[field])
+            except Exception as e:
+                print(f"  {collection} {doc['id']}: {e}")
+                continue
+            if variants is None:
+                continue
+            # Only record them if the document still points at the same image
+            await db[collection].update_one({"id": doc["id"], field: doc[field]}, {"$set": {variants_field: variants}})
+            done += 1
+        totals[collection] = done
+    return totals
+
+
+async def main(args: list):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+
+    command = args[0] if args else "backfill"
+    if command == "backfill":
+        totals = await backfill(db, force="--force" in args)
+        for collection, done in totals.items():
+            print(f"{collection}: generated variants for {done} images")
+    else:
+        print(f"Unknown command: {command}")
+    shutdown()
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
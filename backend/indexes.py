@@ -0,0 +1,352 @@
+"""
+Index registry for every collection the API queries.
+
+Applied idempotently from the startup hook. Run as a script to report missing,
+unused or ineffective indexes:
+
+    python indexes.py report
+    python indexes.py apply
+"""
+import asyncio
+import logging
+import os
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Every index is named explicitly so the registry can be diffed against the
+# server by name. The comment above each index lists the routes it serves.
+INDEXES = {
+    "users": [
+        # get_current_user, get_user, follow_user, update_* and delete_user
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # login, register
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        # register, update_user_settings, update_user_admin, startup_db
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        # get_home_data (trending users), get_ranking
+        IndexModel([("language", ASCENDING), ("followers_count", DESCENDING)], name="language_followers"),
+        # get_all_users (keyset pagination)
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_id"),
+        # reconcile (incremental runs)
+        IndexModel([("counters_touched_at", ASCENDING)], name="counters_touched", sparse=True),
+    ],
+    "quotes": [
+        # get_quote, delete_quote, like_quote, save_quote, get_share_data
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # get_quotes (no filter), get_all_quotes_admin, get_trending
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_id"),
+        # get_quotes?user_id=, get_user_quotes
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_created_id"),
+        # get_user_quotes?sort_by=most_liked|most_saved|most_viewed
+        IndexModel([("user_id", ASCENDING), ("likes_count", DESCENDING)], name="user_likes"),
+        IndexModel([("user_id", ASCENDING), ("saves_count", DESCENDING)], name="user_saves"),
+        IndexModel([("user_id", ASCENDING), ("views_count", DESCENDING)], name="user_views"),
+        # get_quotes?category_id=
+        IndexModel([("category_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="category_created_id"),
+        # get_quotes?language=, get_home_data
+        IndexModel([("language", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="language_created_id"),
+        # get_most_liked, get_most_saved, get_most_viewed
+        IndexModel([("likes_count", DESCENDING), ("id", DESCENDING)], name="likes_count_id"),
+        IndexModel([("saves_count", DESCENDING), ("id", DESCENDING)], name="saves_count_id"),
+        IndexModel([("views_count", DESCENDING), ("id", DESCENDING)], name="views_count_id"),
+        # get_most_liked, get_most_saved, get_most_viewed with ?language= (also TopKLists reloads)
+        IndexModel([("language", ASCENDING), ("likes_count", DESCENDING), ("id", DESCENDING)], name="language_likes_count_id"),
+        IndexModel([("language", ASCENDING), ("saves_count", DESCENDING), ("id", DESCENDING)], name="language_saves_count_id"),
+        IndexModel([("language", ASCENDING), ("views_count", DESCENDING), ("id", DESCENDING)], name="language_views_count_id"),
+        # reconcile (incremental runs)
+        IndexModel([("counters_touched_at", ASCENDING)], name="counters_touched", sparse=True),
+    ],
+    "likes": [
+        # like_quote, get_quote_status, get_user_liked_quotes
+        IndexModel([("user_id", ASCENDING), ("quote_id", ASCENDING)], name="user_quote_unique", unique=True),
+        # delete_quote_admin
+        IndexModel([("quote_id", ASCENDING)], name="quote_id"),
+    ],
+    "saves": [
+        # save_quote, get_quote_status, get_user_saved
+        IndexModel([("user_id", ASCENDING), ("quote_id", ASCENDING)], name="user_quote_unique", unique=True),
+        # delete_quote_admin
+        IndexModel([("quote_id", ASCENDING)], name="quote_id"),
+    ],
+    "follows": [
+        # follow_user, get_follow_status, delete_user
+        IndexModel([("follower_id", ASCENDING), ("following_id", ASCENDING)], name="follower_following_unique", unique=True),
+        # delete_user
+        IndexModel([("following_id", ASCENDING)], name="following_id"),
+    ],
+    "messages": [
+        # get_messages
+        IndexModel([("conversation_id", ASCENDING), ("created_at", DESCENDING)], name="conversation_created"),
+        # delete_user, migrate_conversations
+        IndexModel([("sender_id", ASCENDING), ("created_at", DESCENDING)], name="sender_created"),
+        IndexModel([("receiver_id", ASCENDING), ("created_at", DESCENDING)], name="receiver_created"),
+        # get_all_messages
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_id"),
+        # delete_message_admin
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "conversations": [
+        # send_message, get_messages
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # get_conversations, delete_user
+        IndexModel([("participants", ASCENDING), ("last_message_at", DESCENDING)], name="participants_last_message"),
+    ],
+    "notifications": [
+        # get_notifications
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_created"),
+        # mark_notification_read
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # mark_all_notifications_read, unread.reconcile
+        IndexModel(
+            [("user_id", ASCENDING)],
+            name="user_unread",
+            partialFilterExpression={"read": False},
+        ),
+    ],
+    "categories": [
+        # get_category, update_category, category translation routes
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # create_category
+        IndexModel([("slug", ASCENDING)], name="slug_unique", unique=True),
+        # get_categories
+        IndexModel([("parent_id", ASCENDING), ("name", ASCENDING)], name="parent_name"),
+        # get_home_data (trending categories)
+        IndexModel([("quotes_count", DESCENDING)], name="quotes_count"),
+        # reconcile (incremental runs)
+        IndexModel([("counters_touched_at", ASCENDING)], name="counters_touched", sparse=True),
+    ],
+    "blogs": [
+        # get_blog, update_blog, delete_blog
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # create_blog
+        IndexModel([("slug", ASCENDING)], name="slug"),
+        # get_blogs, get_home_data
+        IndexModel(
+            [("published", ASCENDING), ("language", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="published_language_created_id"
+        ),
+        IndexModel([("published", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="published_created_id"),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_id"),
+    ],
+    "backgrounds": [
+        # get_backgrounds
+        IndexModel([("type", ASCENDING)], name="type"),
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "languages": [
+        # create_language
+        IndexModel([("code", ASCENDING)], name="code_unique", unique=True),
+        # update_language, delete_language
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "user_stats_daily": [
+        # leaderboard.record, leaderboard.rebuild ($merge target)
+        IndexModel([("user_id", ASCENDING), ("day", ASCENDING)], name="user_day_unique", unique=True),
+        # get_ranking
+        IndexModel([("day", ASCENDING), ("user_id", ASCENDING)], name="day_user"),
+    ],
+    "quote_search": [
+        # get_quotes?search= (the override keeps the quote's own `language` code
+        # from being read as a text-search language)
+        IndexModel(
+            [("content", TEXT), ("author", TEXT), ("tags", TEXT)],
+            name="text",
+            weights={"content": 3, "author": 2, "tags": 2},
+            default_language="none",
+            language_override="search_language",
+        ),
+        # quote_search.index_quote, quote_search.unindex_quote
+        IndexModel([("quote_id", ASCENDING)], name="quote_id_unique", unique=True),
+        # delete_user
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "broadcasts": [
+        # get_notifications, get_broadcasts
+        IndexModel([("created_at", DESCENDING)], name="created"),
+        # mark_notification_read, broadcasts.fan_out
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "broadcast_reads": [
+        # get_notifications, mark_notification_read, dismiss_notification
+        IndexModel([("user_id", ASCENDING), ("broadcast_id", ASCENDING)], name="user_broadcast_unique", unique=True),
+        # broadcasts.fan_out
+        IndexModel([("broadcast_id", ASCENDING), ("user_id", ASCENDING)], name="broadcast_user"),
+    ],
+    "jobs": [
+        # get_job
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # JobWorker.claim, get_jobs
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created"),
+    ],
+    "job_schedules": [
+        # JobScheduler.tick
+        IndexModel([("name", ASCENDING)], name="name_unique", unique=True),
+    ],
+    "reconcile_runs": [
+        # reconcile.run, get_reconcile_runs
+        IndexModel([("status", ASCENDING), ("started_at", DESCENDING)], name="status_started"),
+    ],
+    "unread_counters": [
+        # unread.increment, unread.get_counts
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "trending": [
+        # trending.record_many, trending.remove_quotes
+        IndexModel([("quote_id", ASCENDING)], name="quote_id_unique", unique=True),
+        # get_trending?language=, get_home_data
+        IndexModel([("language", ASCENDING), ("epoch", ASCENDING), ("score", DESCENDING)], name="language_epoch_score"),
+        # get_trending, trending.maintain
+        IndexModel([("epoch", ASCENDING), ("score", DESCENDING)], name="epoch_score"),
+    ],
+    "site_translations": [
+        # get_site_translations, update_site_translations
+        IndexModel([("language_code", ASCENDING)], name="language_code_unique", unique=True),
+    ],
+}
+
+# Representative query shapes issued by the routes, used by the report to
+# check through explain() that each one is served by an index.
+QUERY_SHAPES = [
+    {"route": "GET /api/quotes", "collection": "quotes", "filter": {}, "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "GET /api/quotes?user_id=", "collection": "quotes", "filter": {"user_id": "x"}, "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "GET /api/quotes?category_id=", "collection": "quotes", "filter": {"category_id": "x"}, "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "GET /api/quotes?language=", "collection": "quotes", "filter": {"language": "en"}, "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "GET /api/quotes/{id}", "collection": "quotes", "filter": {"id": "x"}},
+    {"route": "GET /api/discover/liked", "collection": "quotes", "filter": {}, "sort": [("likes_count", -1), ("id", -1)]},
+    {"route": "GET /api/discover/saved", "collection": "quotes", "filter": {}, "sort": [("saves_count", -1), ("id", -1)]},
+    {"route": "GET /api/discover/viewed", "collection": "quotes", "filter": {}, "sort": [("views_count", -1), ("id", -1)]},
+    {"route": "GET /api/discover/liked?language=", "collection": "quotes", "filter": {"language": "en"}, "sort": [("likes_count", -1), ("id", -1)]},
+    {"route": "GET /api/users/{id}/quotes", "collection": "quotes", "filter": {"user_id": "x"}, "sort": [("likes_count", -1)]},
+    {"route": "POST /api/quotes/{id}/like", "collection": "likes", "filter": {"user_id": "x", "quote_id": "y"}},
+    {"route": "POST /api/quotes/{id}/save", "collection": "saves", "filter": {"user_id": "x", "quote_id": "y"}},
+    {"route": "POST /api/users/{id}/follow", "collection": "follows", "filter": {"follower_id": "x", "following_id": "y"}},
+    {"route": "GET /api/messages/{user_id}", "collection": "messages", "filter": {"conversation_id": "x:y"}, "sort": [("created_at", -1)]},
+    {"route": "GET /api/messages/conversations", "collection": "conversations", "filter": {"participants": "x"}, "sort": [("last_message_at", -1)]},
+    {"route": "GET /api/notifications", "collection": "notifications", "filter": {"user_id": "x"}, "sort": [("created_at", -1)]},
+    {"route": "GET /api/unread/counts", "collection": "unread_counters", "filter": {"user_id": "x"}},
+    {"route": "GET /api/categories", "collection": "categories", "filter": {"parent_id": None}, "sort": [("name", 1)]},
+    {"route": "GET /api/blogs", "collection": "blogs", "filter": {"published": True, "language": "en"}, "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "GET /api/ranking", "collection": "user_stats_daily", "filter": {"day": {"$gte": "2025-01-01"}}},
+    {"route": "GET /api/auth/me", "collection": "users", "filter": {"id": "x"}},
+    {"route": "GET /api/discover/trending", "collection": "trending", "filter": {"epoch": "x"}, "sort": [("score", -1)]},
+    {"route": "GET /api/home", "collection": "trending", "filter": {"language": "en", "epoch": "x"}, "sort": [("score", -1)]},
+]
+
+
+def _same_key(existing: dict, model: IndexModel) -> bool:
+    key = list(model.document["key"].items())
+    if any(kind == TEXT for _, kind in key):
+        # The server stores text indexes under _fts/_ftsx; the indexed fields are in `weights`
+        weights = model.document.get("weights", {})
+        return dict(existing.get("weights", {})) == {field: weights.get(field, 1) for field, kind in key if kind == TEXT}
+    return list(existing["key"]) == key
+
+
+async def ensure_indexes(db):
+    """Create every registered index that does not exist yet."""
+    created = []
+    for collection, models in INDEXES.items():
+        existing = await db[collection].index_information()
+        for model in models:
+            name = model.document["name"]
+            if name in existing:
+                if not _same_key(existing[name], model):
+                    logger.warning(f"Index {collection}.{name} exists with a different key, leaving it as is")
+                continue
+            try:
+                await db[collection].create_indexes([model])
+                created.append(f"{collection}.{name}")
+            except OperationFailure as e:
+                # Typically duplicate data blocking a unique index; keep starting up
+                logger.error(f"Could not create index {collection}.{name}: {e}")
+    if created:
+        logger.info(f"Created indexes: {', '.join(created)}")
+    return created
+
+
+def _plan_stages(plan: dict) -> list:
+    stages = [plan.get("stage")]
+    if "inputStage" in plan:
+        stages += _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+
+async def explain_shapes(db):
+    results = []
+    for shape in QUERY_SHAPES:
+        cursor = db[shape["collection"]].find(shape["filter"])
+        if shape.get("sort"):
+            cursor = cursor.sort(shape["sort"])
+        explain = await cursor.explain()
+        winning = explain.get("queryPlanner", {}).get("winningPlan", {})
+        stages = _plan_stages(winning.get("queryPlan", winning))
+        results.append({
+            "route": shape["route"],
+            "collection": shape["collection"],
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+            "in_memory_sort": "SORT" in stages,
+        })
+    return results
+
+
+async def index_report(db):
+    """Compare the registry with the server and collect $indexStats usage."""
+    missing, unregistered, unused = [], [], []
+    for collection, models in INDEXES.items():
+        existing = await db[collection].index_information()
+        registered = {m.document["name"] for m in models}
+        missing += [f"{collection}.{name}" for name in registered if name not in existing]
+        unregistered += [f"{collection}.{name}" for name in existing if name != "_id_" and name not in registered]
+        async for stat in db[collection].aggregate([{"$indexStats": {}}]):
+            if stat["name"] != "_id_" and stat["accesses"]["ops"] == 0:
+                unused.append(f"{collection}.{stat['name']} (since {stat['accesses']['since']})")
+    return {
+        "missing": sorted(missing),
+        "unregistered": sorted(unregistered),
+        "unused": sorted(unused),
+        "query_shapes": await explain_shapes(db),
+    }
+
+
+async def main(command: str):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    if command == "apply":
+        created = await ensure_indexes(db)
+        print(f"Created {len(created)} indexes")
+        for name in created:
+            print(f"  + {name}")
+    else:
+        report = await index_report(db)
+        print("Missing indexes:")
+        for name in report["missing"] or ["(none)"]:
+            print(f"  {name}")
+        print("Indexes not in the registry:")
+        for name in report["unregistered"] or ["(none)"]:
+            print(f"  {name}")
+        print("Indexes with no recorded use:")
+        for name in report["unused"] or ["(none)"]:
+            print(f"  {name}")
+        print("Query shapes:")
+        for shape in report["query_shapes"]:
+            flag = "COLLSCAN" if shape["collscan"] else ("SORT" if shape["in_memory_sort"] else "ok")
+            print(f"  [{flag}] {shape['route']}: {' <- '.join(s for s in shape['stages'] if s)}")
+    client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "report"))
@@ -0,0 +1,278 @@
+"""
+Durable background jobs stored in Mongo.
+
+Routes enqueue a job document in `jobs` and return its id straight away; a
+worker started with the app claims queued jobs one at a time and runs the
+handler registered for the job type. A claimed job holds a lease that the
+worker keeps renewing while it runs; if the worker dies, the lease expires
+and the job is picked up again, so handlers must be safe to re-run. A worker
+that fails to renew its lease, or finds the job taken over when it reports
+progress, stops the job rather than run it alongside the new owner.
+"""
+import asyncio
+import logging
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "jobs"
+SCHEDULES = "job_schedules"
+
+
+class LeaseLost(Exception):
+    """The job's lease is no longer held by this worker, so it must stop running it."""
+
+
+def new_job(job_type: str, params: dict, max_attempts: int = 3) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "type": job_type,
+        "params": params,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "progress": {},
+        "error": None,
+        "created_at": datetime.now(timezone.utc),
+        "started_at": None,
+        "finished_at": None,
+    }
+
+
+async def enqueue(db, job_type: str, params: dict, max_attempts: int = 3) -> dict:
+    job = new_job(job_type, params, max_attempts)
+    await db[COLLECTION].insert_one(job)
+    job.pop("_id", None)
+    return job
+
+
+async def get(db, job_id: str):
+    return await db[COLLECTION].find_one({"id": job_id}, {"_id": 0, "locked_until": 0, "worker": 0})
+
+
+class JobWorker:
+    def __init__(self, db, handlers: dict, poll_interval: float = 1.0, lease_seconds: float = 60.0):
+        self.db = db
+        self.handlers = handlers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.name = f"{socket.gethostname()}:{uuid.uuid4().hex[:8]}"
+        self._wake = asyncio.Event()
+        self._task = None
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.leases_lost = 0
+        self.current = None
+        self.last_job_seconds = 0.0
+
+    def notify(self):
+        """Wake the worker after enqueueing so it doesn't wait for the next poll."""
+        self._wake.set()
+
+    async def claim(self):
+        now = datetime.now(timezone.utc)
+        job = await self.db[COLLECTION].find_one_and_update(
+            {
+                "type": {"$in": list(self.handlers)},
+                "$or": [
+                    {"status": "queued"},
+                    {"status": "running", "locked_until": {"$lt": now}},
+                ]
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "worker": self.name,
+                    "started_at": now,
+                    "locked_until": now + timedelta(seconds=self.lease_seconds),
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if job is not None:
+            job.pop("_id", None)
+        return job
+
+    async def _update(self, job_id: str, update: dict) -> bool:
+        """Update the job if this worker still holds it; False if it has been taken over."""
+        result = await self.db[COLLECTION].update_one({"id": job_id, "worker": self.name, "status": "running"}, update)
+        return result.matched_count > 0
+
+    async def _heartbeat(self, job_id: str):
+        """Renew the lease until it fails; returning means the job must stop."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                renewed = await self._update(
+                    job_id, {"$set": {"locked_until": datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)}}
+                )
+            except Exception:
+                logger.exception("Renewing the lease on job %s failed", job_id)
+                return
+            if not renewed:
+                return
+
+    async def run_job(self, job: dict):
+        async def progress(**fields):
+            if not await self._update(job["id"], {"$set": {f"progress.{k}": v for k, v in fields.items()}}):
+                raise LeaseLost(job["id"])
+
+        self.current = job["id"]
+        handler = asyncio.create_task(self.handlers[job["type"]](self.db, job, progress))
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        started = time.perf_counter()
+        try:
+            await asyncio.wait({handler, heartbeat}, return_when=asyncio.FIRST_COMPLETED)
+            if not handler.done():
+                handler.cancel()
+                await asyncio.gather(handler, return_exceptions=True)
+                raise LeaseLost(job["id"])
+            handler.result()
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back for the next worker
+            handler.cancel()
+            await asyncio.gather(handler, return_exceptions=True)
+            await self._update(job["id"], {"$set": {"status": "queued"}, "$inc": {"attempts": -1}})
+            raise
+        except LeaseLost:
+            # Another worker may own the job now; leave its status alone
+            logger.error("Lost the lease on job %s (%s); stopped it", job["id"], job["type"])
+            self.leases_lost += 1
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", job["id"], job["type"])
+            retry = job["attempts"] < job.get("max_attempts", 3)
+            await self._update(
+                job["id"],
+                {"$set": {
+                    "status": "queued" if retry else "failed",
+                    "error": str(e),
+                    "finished_at": None if retry else datetime.now(timezone.utc),
+                }}
+            )
+            if retry:
+                self.retried += 1
+            else:
+                self.failed += 1
+        else:
+            if await self._update(
+                job["id"], {"$set": {"status": "done", "error": None, "finished_at": datetime.now(timezone.utc)}}
+            ):
+                self.completed += 1
+            else:
+                logger.error("Job %s (%s) finished after its lease was lost", job["id"], job["type"])
+                self.leases_lost += 1
+        finally:
+            heartbeat.cancel()
+            self.current = None
+            self.last_job_seconds = time.perf_counter() - started
+
+    async def _run(self):
+        while True:
+            try:
+                job = await self.claim()
+            except Exception:
+                logger.exception("Failed to claim a job")
+                job = None
+            if job is not None:
+                await self.run_job(job)
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "worker": self.name,
+            "current_job": self.current,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "leases_lost": self.leases_lost,
+            "last_job_seconds": round(self.last_job_seconds, 3),
+        }
+
+
+class JobScheduler:
+    """Enqueues recurring jobs. Each job type has a document in `job_schedules`
+    holding its next due time; a run is enqueued only by the worker whose update
+    moves that time forward, so several app workers sharing a database still
+    enqueue each run once."""
+
+    def __init__(self, db, schedules: dict, on_enqueue=None, check_interval: float = 30.0):
+        # schedules: job type -> (interval seconds, params)
+        self.db = db
+        self.schedules = schedules
+        self.on_enqueue = on_enqueue
+        self.check_interval = check_interval
+        self._task = None
+
+    async def _ensure_schedule(self, job_type: str, interval: float, now: datetime):
+        # The first run is due one interval after the last job of the type, or now
+        last = await self.db[COLLECTION].find_one({"type": job_type}, {"_id": 0, "created_at": 1}, sort=[("created_at", -1)])
+        due = last["created_at"] + timedelta(seconds=interval) if last else now
+        try:
+            await self.db[SCHEDULES].update_one(
+                {"name": job_type}, {"$setOnInsert": {"name": job_type, "next_run_at": due}}, upsert=True
+            )
+        except DuplicateKeyError:
+            pass
+
+    async def tick(self):
+        now = datetime.now(timezone.utc)
+        for job_type, (interval, params) in self.schedules.items():
+            if not await self.db[SCHEDULES].find_one({"name": job_type}, {"_id": 1}):
+                await self._ensure_schedule(job_type, interval, now)
+            claimed = await self.db[SCHEDULES].find_one_and_update(
+                {"name": job_type, "next_run_at": {"$lte": now}},
+                {"$set": {"next_run_at": now + timedelta(seconds=interval)}}
+            )
+            if claimed is None:
+                continue
+            await enqueue(self.db, job_type, params)
+            if self.on_enqueue:
+                self.on_enqueue()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception:
+                logger.exception("Failed to schedule jobs")
+            await asyncio.sleep(self.check_interval)
+
+    def start(self):
+        if self._task is None and self.schedules:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,183 @@
+"""
+Materialized per-user daily stat buckets backing /api/ranking.
+
+Each bucket holds the counters of the quotes a user created on one day, so a
+ranking period is a single aggregation over the buckets since its start day.
+Rebuild every bucket from the quotes collection with:
+
+    python leaderboard.py rebuild
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from indexes import ensure_indexes
+
+COLLECTION = "user_stats_daily"
+
+# Score weights used by the ranking: quotes, views, likes, saves
+QUOTE_WEIGHT = 10
+VIEW_WEIGHT = 1
+LIKE_WEIGHT = 5
+SAVE_WEIGHT = 8
+
+SCORE = {"$add": [
+    {"$multiply": ["$quotes_count", QUOTE_WEIGHT]},
+    {"$multiply": ["$total_views", VIEW_WEIGHT]},
+    {"$multiply": ["$total_likes", LIKE_WEIGHT]},
+    {"$multiply": ["$total_saves", SAVE_WEIGHT]},
+]}
+
+
+def bucket_day(created_at) -> str:
+    if isinstance(created_at, datetime):
+        return created_at.strftime("%Y-%m-%d")
+    return created_at[:10]
+
+
+def bucket_update(user_id: str, created_at, quotes: int = 0, views: int = 0, likes: int = 0, saves: int = 0) -> UpdateOne:
+    deltas = {"quotes": quotes, "views": views, "likes": likes, "saves": saves}
+    return UpdateOne(
+        {"user_id": user_id, "day": bucket_day(created_at)},
+        {"$inc": {k: v for k, v in deltas.items() if v}},
+        upsert=True
+    )
+
+
+async def record(db, user_id: str, created_at, **deltas):
+    """Apply counter deltas to the bucket of a quote created at `created_at`."""
+    await db[COLLECTION].bulk_write([bucket_update(user_id, created_at, **deltas)])
+
+
+async def remove_user(db, user_id: str):
+    await db[COLLECTION].delete_many({"user_id": user_id})
+
+
+async def _top_of_ranking(db, day: str, limit: int) -> list:
+    ranked = [
+        {"$match": {"day": {"$gte": day}}},
+        {"$group": {
+            "_id": "$user_id",
+            "quotes_count": {"$sum": "$quotes"},
+            "total_views": {"$sum": "$views"},
+            "total_likes": {"$sum": "$likes"},
+            "total_saves": {"$sum": "$saves"},
+        }},
+        {"$addFields": {"score": SCORE}},
+        {"$sort": {"score": -1, "_id": 1}},
+    ]
+    # Only the top of the ranking needs its user looked up; buckets of a deleted user
+    # linger until its delete_user job removes them, so look further until enough resolve
+    fetch = limit
+    while True:
+        rows = await db[COLLECTION].aggregate(ranked + [
+            {"$limit": fetch},
+            {"$lookup": {"from": "users", "localField": "_id", "foreignField": "id", "as": "user"}},
+            {"$unwind": {"path": "$user", "preserveNullAndEmptyArrays": True}},
+            {"$project": {"_id": 0, "user._id": 0, "user.password_hash": 0}},
+        ]).to_list(fetch)
+        users = [r for r in rows if r.get("user")]
+        if len(users) >= limit or len(rows) < fetch:
+            return users[:limit]
+        fetch *= 2
+
+
+async def _top_of_users(db, day: str, user_match: dict, limit: int) -> list:
+    # The filter narrows the users, so rank only theirs from the (user_id, day) buckets
+    pipeline = [
+        {"$match": user_match},
+        {"$lookup": {
+            "from": COLLECTION,
+            "localField": "id",
+            "foreignField": "user_id",
+            "pipeline": [{"$match": {"day": {"$gte": day}}}],
+            "as": "buckets"
+        }},
+        {"$match": {"buckets.0": {"$exists": True}}},
+        {"$project": {
+            "_id": 0,
+            "quotes_count": {"$sum": "$buckets.quotes"},
+            "total_views": {"$sum": "$buckets.views"},
+            "total_likes": {"$sum": "$buckets.likes"},
+            "total_saves": {"$sum": "$buckets.saves"},
+            "user": "$$ROOT",
+        }},
+        {"$addFields": {"score": SCORE}},
+        {"$sort": {"score": -1, "user.id": 1}},
+        {"$limit": limit},
+        {"$project": {"user._id": 0, "user.password_hash": 0, "user.buckets": 0}},
+    ]
+    return await db.users.aggregate(pipeline).to_list(limit)
+
+
+async def top_users(db, start: datetime, language: str = None, search: str = None, limit: int = 50):
+    """The `limit` best scoring users since `start`, which must be a midnight (buckets hold whole days)."""
+    if (start.hour, start.minute, start.second, start.microsecond) != (0, 0, 0, 0):
+        raise ValueError(f"Ranking periods start at midnight, got {start.isoformat()}")
+    user_match = {}
+    if language:
+        user_match['language'] = language
+    if search:
+        user_match['$or'] = [
+            {'username': {'$regex': search, '$options': 'i'}},
+            {'full_name': {'$regex': search, '$options': 'i'}}
+        ]
+    if user_match:
+        return await _top_of_users(db, bucket_day(start), user_match, limit)
+    return await _top_of_ranking(db, bucket_day(start), limit)
+
+
+async def rebuild(db):
+    """Recompute every bucket from the quotes collection."""
+    # $merge needs the unique (user_id, day) index to exist
+    await ensure_indexes(db)
+    await db[COLLECTION].delete_many({})
+    pipeline = [
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "day": {"$cond": [
+                    {"$eq": [{"$type": "$created_at"}, "date"]},
+                    {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                    {"$substrCP": ["$created_at", 0, 10]}
+                ]}
+            },
+            "quotes": {"$sum": 1},
+            "views": {"$sum": {"$ifNull": ["$views_count", 0]}},
+            "likes": {"$sum": {"$ifNull": ["$likes_count", 0]}},
+            "saves": {"$sum": {"$ifNull": ["$saves_count", 0]}},
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "day": "$_id.day",
+            "quotes": 1, "views": 1, "likes": 1, "saves": 1
+        }},
+        {"$merge": {"into": COLLECTION, "on": ["user_id", "day"], "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+    await db.quotes.aggregate(pipeline).to_list(None)
+    return await db[COLLECTION].count_documents({})
+
+
+async def main(command: str):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    if command == "rebuild":
+        count = await rebuild(db)
+        print(f"Rebuilt {count} daily buckets")
+    else:
+        print(f"Unknown command: {command}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "rebuild"))
@@ -0,0 +1,88 @@
+"""
+Backfill conversation keys on messages and build the conversations collection.
+
+Messages without a `conversation_id` get one in batches, then one summary
+document per conversation is created from the message history (latest message
+and the unread counts implied by the legacy `read` flags). Existing summary
+documents are left untouched, so the script is safe to re-run.
+
+    python migrate_conversations.py [batch_size]
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+from conversations import conversation_key
+
+
+async def backfill_message_keys(db, batch_size: int = 1000):
+    updated = 0
+    while True:
+        docs = await db.messages.find(
+            {"conversation_id": {"$exists": False}},
+            {"_id": 1, "sender_id": 1, "receiver_id": 1}
+        ).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not docs:
+            break
+        result = await db.messages.bulk_write([
+            UpdateOne({"_id": d["_id"]}, {"$set": {"conversation_id": conversation_key(d["sender_id"], d["receiver_id"])}})
+            for d in docs
+        ], ordered=False)
+        updated += result.modified_count
+        print(f"  messages: {updated} keyed")
+    return updated
+
+
+async def build_conversations(db, batch_size: int = 1000):
+    unread = {}
+    async for row in db.messages.aggregate([
+        {"$match": {"read": False}},
+        {"$group": {"_id": {"conversation_id": "$conversation_id", "receiver_id": "$receiver_id"}, "count": {"$sum": 1}}}
+    ], allowDiskUse=True):
+        unread.setdefault(row["_id"]["conversation_id"], {})[row["_id"]["receiver_id"]] = row["count"]
+
+    created = 0
+    ops = []
+    async for row in db.messages.aggregate([
+        {"$sort": {"created_at": -1}},
+        {"$group": {"_id": "$conversation_id", "last_message": {"$first": "$$ROOT"}}}
+    ], allowDiskUse=True):
+        last_message = row["last_message"]
+        last_message.pop("_id", None)
+        ops.append(UpdateOne(
+            {"id": row["_id"]},
+            {"$setOnInsert": {
+                "last_message": last_message,
+                "last_message_at": last_message["created_at"],
+                "participants": sorted([last_message["sender_id"], last_message["receiver_id"]]),
+                "unread": unread.get(row["_id"], {}),
+            }},
+            upsert=True
+        ))
+        if len(ops) >= batch_size:
+            result = await db.conversations.bulk_write(ops, ordered=False)
+            created += result.upserted_count
+            ops = []
+    if ops:
+        result = await db.conversations.bulk_write(ops, ordered=False)
+        created += result.upserted_count
+    return created
+
+
+async def migrate(db, batch_size: int = 1000):
+    keyed = await backfill_message_keys(db, batch_size)
+    print(f"Keyed {keyed} messages")
+    created = await build_conversations(db, batch_size)
+    print(f"Created {created} conversations")
+
+
+if __name__ == "__main__":
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    asyncio.run(migrate(db, int(sys.argv[1]) if len(sys.argv) > 1 else 1000))
@@ -0,0 +1,85 @@
+"""
+Convert ISO-string timestamps to native BSON dates, in place.
+
+Runs online in batches: each update is conditional on the stored string so a
+concurrent write is never overwritten, and documents that are already
+converted no longer match, so the script can be stopped and re-run at any time.
+
+    python migrate_dates.py [batch_size]
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+DATE_FIELDS = {
+    "users": ["created_at"],
+    "quotes": ["created_at"],
+    "categories": ["created_at"],
+    "messages": ["created_at"],
+    "follows": ["created_at"],
+    "likes": ["created_at"],
+    "saves": ["created_at"],
+    "backgrounds": ["created_at"],
+    "blogs": ["created_at", "updated_at"],
+    "languages": ["created_at", "updated_at"],
+    "notifications": ["created_at"],
+    "admin_settings": ["updated_at"],
+    "system_settings": ["updated_at"],
+    "site_translations": ["created_at", "updated_at"],
+}
+
+
+def parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+async def migrate_field(db, collection: str, field: str, batch_size: int = 1000):
+    converted = 0
+    skipped = 0
+    last_id = None
+    while True:
+        query = {field: {"$type": "string"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = await db[collection].find(query, {"_id": 1, field: 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+
+        ops = []
+        for doc in docs:
+            try:
+                value = parse_timestamp(doc[field])
+            except ValueError:
+                skipped += 1
+                continue
+            ops.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: value}}))
+        if ops:
+            result = await db[collection].bulk_write(ops, ordered=False)
+            converted += result.modified_count
+        print(f"  {collection}.{field}: {converted} converted")
+    return converted, skipped
+
+
+async def migrate(db, batch_size: int = 1000):
+    for collection, fields in DATE_FIELDS.items():
+        for field in fields:
+            converted, skipped = await migrate_field(db, collection, field, batch_size)
+            if converted or skipped:
+                print(f"{collection}.{field}: {converted} converted, {skipped} unparseable values left as is")
+
+
+if __name__ == "__main__":
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    asyncio.run(migrate(db, int(sys.argv[1]) if len(sys.argv) > 1 else 1000))
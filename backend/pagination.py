@@ -0,0 +1,82 @@
+"""
+Keyset (cursor) pagination for list routes.
+
+A cursor is an opaque token holding the sort key and `id` of the last row of
+a page. The next page starts strictly after that pair, so Mongo seeks through
+the (sort_field, id) index instead of skipping rows.
+"""
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        # Anything but a date would be read as a query operator
+        if list(value) != ["$date"]:
+            raise ValueError("unexpected object in cursor")
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+
+def encode_cursor(doc: dict, sort_field: str) -> str:
+    payload = json.dumps([sort_field, _encode_value(doc.get(sort_field)), doc["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, sort_field: str):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        field, value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = _decode_value(value)
+        if not isinstance(last_id, str):
+            raise TypeError("cursor id must be a string")
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if field != sort_field:
+        raise HTTPException(status_code=400, detail="Cursor does not match the requested ordering")
+    return value, last_id
+
+
+def keyset_filter(sort_field: str, value, last_id: str) -> dict:
+    # Descending order on (sort_field, id)
+    return {"$or": [
+        {sort_field: {"$lt": value}},
+        {sort_field: value, "id": {"$lt": last_id}}
+    ]}
+
+
+async def find_page(collection, query: dict, sort_field: str, limit: int, skip: int = 0,
+                    cursor: str = None, projection: dict = None):
+    """Return one page sorted by (sort_field, id) descending and the cursor of the next page.
+
+    An empty cursor starts from the first page; `skip` is only honoured when
+    no cursor is given, for clients still paging by offset.
+    """
+    if limit <= 0:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort_field)
+        keyset = keyset_filter(sort_field, value, last_id)
+        query = {"$and": [query, keyset]} if query else keyset
+    find = collection.find(query, projection or {"_id": 0}).sort([(sort_field, -1), ("id", -1)])
+    if skip and not cursor:
+        find = find.skip(skip)
+    rows = await find.limit(limit + 1).to_list(limit + 1)
+    next_cursor = encode_cursor(rows[limit - 1], sort_field) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def page_response(items: list, next_cursor: str, cursor: str):
+    # Plain lists for offset clients, an envelope once a cursor is in play
+    if cursor is None:
+        return items
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,191 @@
+"""
+Internal publish/subscribe for real-time events.
+
+Routes publish events to a topic ("user:<id>" or "broadcast"); each worker
+delivers what it receives to its own WebSocket connections. Two backends:
+
+- memory: delivers in process, enough for a single worker.
+- mongo: appends events to a capped collection that every worker tails, so
+  an event published by one worker reaches sockets held by the others.
+
+The backend is chosen with PUBSUB_BACKEND (default "memory").
+
+Delivery only queues an event for each socket; every connection has its own
+sender task, so publishing (and the request that publishes) never waits on a
+slow client. A client whose queue fills up is disconnected and reloads over
+HTTP when it reconnects.
+"""
+import asyncio
+import logging
+import time
+
+from bson import Timestamp
+from fastapi import WebSocket
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._handler = None
+        self.published = 0
+
+    async def start(self, handler):
+        self._handler = handler
+
+    async def stop(self):
+        self._handler = None
+
+    async def publish(self, topic: str, event: dict):
+        self.published += 1
+        if self._handler is not None:
+            await self._handler(topic, event, time.time())
+
+
+class MongoBroker:
+    def __init__(self, db, collection: str = "pubsub_events", size_bytes: int = 16 * 1024 * 1024):
+        self.db = db
+        self.collection = collection
+        self.size_bytes = size_bytes
+        self._task = None
+        self.published = 0
+
+    async def start(self, handler):
+        try:
+            await self.db.create_collection(self.collection, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass
+        self._task = asyncio.create_task(self._tail(handler))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def publish(self, topic: str, event: dict):
+        self.published += 1
+        # The server replaces the empty timestamp with its own, unique and increasing in insert order
+        await self.db[self.collection].insert_one(
+            {"ts": Timestamp(0, 0), "topic": topic, "event": event, "published_at": time.time()}
+        )
+
+    async def _tail(self, handler):
+        # Only events published after this worker started are delivered
+        latest = await self.db[self.collection].find_one({}, sort=[("$natural", -1)])
+        last_ts = (latest or {}).get("ts") or Timestamp(0, 0)
+        while True:
+            # Events are read in insertion order from one open cursor; `ts` only resumes a dead one
+            cursor = self.db[self.collection].find(
+                {"ts": {"$gt": last_ts}}, cursor_type=CursorType.TAILABLE_AWAIT
+            ).sort("$natural", 1)
+            try:
+                while cursor.alive:
+                    async for doc in cursor:
+                        last_ts = doc["ts"]
+                        await handler(doc["topic"], doc["event"], doc["published_at"])
+                    await asyncio.sleep(0.1)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Pub/sub tail failed, restarting")
+            await asyncio.sleep(1)
+
+
+class ConnectionManager:
+    """WebSocket connections of this worker, by user id."""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._connections = {}
+        # websocket -> (queue of (event, published_at), sender task)
+        self._senders = {}
+        # Close handshakes of dropped slow clients, kept referenced until they finish
+        self._closing = set()
+        self.events_delivered = 0
+        self.messages_sent = 0
+        self.slow_disconnects = 0
+        self.fanout_seconds_total = 0.0
+        self.fanout_seconds_max = 0.0
+
+    def connect(self, user_id: str, websocket: WebSocket):
+        self._connections.setdefault(user_id, set()).add(websocket)
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._senders[websocket] = (queue, asyncio.create_task(self._send(user_id, websocket, queue)))
+
+    def disconnect(self, user_id: str, websocket: WebSocket):
+        sockets = self._connections.get(user_id)
+        if sockets is not None:
+            sockets.discard(websocket)
+            if not sockets:
+                del self._connections[user_id]
+        sender = self._senders.pop(websocket, None)
+        if sender is not None and sender[1] is not asyncio.current_task():
+            sender[1].cancel()
+
+    async def _send(self, user_id: str, websocket: WebSocket, queue: asyncio.Queue):
+        while True:
+            event, published_at = await queue.get()
+            try:
+                await websocket.send_json(event)
+            except Exception:
+                self.disconnect(user_id, websocket)
+                return
+            latency = time.time() - published_at
+            self.messages_sent += 1
+            self.fanout_seconds_total += latency
+            self.fanout_seconds_max = max(self.fanout_seconds_max, latency)
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    async def deliver(self, topic: str, event: dict, published_at: float):
+        if topic == "broadcast":
+            targets = [(uid, ws) for uid, sockets in self._connections.items() for ws in sockets]
+        elif topic.startswith("user:"):
+            uid = topic[len("user:"):]
+            targets = [(uid, ws) for ws in self._connections.get(uid, ())]
+        else:
+            return
+        if not targets:
+            return
+
+        for uid, ws in targets:
+            sender = self._senders.get(ws)
+            if sender is None:
+                continue
+            try:
+                sender[0].put_nowait((event, published_at))
+            except asyncio.QueueFull:
+                # Too far behind to catch up; it reloads over HTTP when it reconnects
+                self.slow_disconnects += 1
+                self.disconnect(uid, ws)
+                task = asyncio.create_task(self._close(ws))
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+        self.events_delivered += 1
+
+    def stats(self) -> dict:
+        return {
+            "connections": sum(len(s) for s in self._connections.values()),
+            "connected_users": len(self._connections),
+            "events_delivered": self.events_delivered,
+            "messages_sent": self.messages_sent,
+            "slow_disconnects": self.slow_disconnects,
+            "fanout_seconds_avg": round(self.fanout_seconds_total / self.messages_sent, 6) if self.messages_sent else 0.0,
+            "fanout_seconds_max": round(self.fanout_seconds_max, 6),
+        }
+
+
+def create_broker(backend: str, db):
+    if backend == "mongo":
+        return MongoBroker(db)
+    return InProcessBroker()
@@ -0,0 +1,156 @@
+"""
+Full-text search over quotes.
+
+Every quote has a companion document in `quote_search` holding its content,
+author and tags after per-language analysis, covered by a weighted Mongo text
+index. Folding happens here rather than in Mongo so Turkish dotted/dotless i
+match the way Turkish readers expect (I -> ı, İ -> i). Each document is stemmed
+in its quote's language and a search is one text query stemmed in the caller's
+language. The companion documents are kept up to date on quote create/delete;
+rebuild them all with:
+
+    python quote_search.py reindex
+"""
+import asyncio
+import os
+import re
+import sys
+import unicodedata
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+COLLECTION = "quote_search"
+
+# Quote language codes mapped to the stemming languages Mongo text indexes know
+TEXT_LANGUAGES = {
+    "da": "danish",
+    "de": "german",
+    "en": "english",
+    "es": "spanish",
+    "fi": "finnish",
+    "fr": "french",
+    "it": "italian",
+    "nl": "dutch",
+    "no": "norwegian",
+    "pt": "portuguese",
+    "ru": "russian",
+    "sv": "swedish",
+    "tr": "turkish",
+}
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def text_language(language: str) -> str:
+    return TEXT_LANGUAGES.get(language, "none")
+
+
+def fold(text: str, language: str = None) -> str:
+    text = unicodedata.normalize("NFC", text)
+    if language in ("tr", "az"):
+        text = text.replace("I", "ı").replace("İ", "i")
+        return text.lower()
+    return text.casefold()
+
+
+def analyze(text: str, language: str = None) -> list:
+    if not text:
+        return []
+    return TOKEN_RE.findall(fold(text, language))
+
+
+def search_document(quote: dict) -> dict:
+    language = quote.get("language")
+    return {
+        "quote_id": quote["id"],
+        "user_id": quote.get("user_id"),
+        "category_id": quote.get("category_id"),
+        "language": language,
+        "search_language": text_language(language),
+        "content": " ".join(analyze(quote.get("content"), language)),
+        "author": " ".join(analyze(quote.get("author"), language)),
+        "tags": " ".join(t for tag in quote.get("tags") or [] for t in analyze(tag, language)),
+    }
+
+
+async def index_quote(db, quote: dict):
+    await db[COLLECTION].replace_one({"quote_id": quote["id"]}, search_document(quote), upsert=True)
+
+
+async def unindex_quote(db, quote_id: str):
+    await db[COLLECTION].delete_one({"quote_id": quote_id})
+
+
+async def unindex_user(db, user_id: str):
+    await db[COLLECTION].delete_many({"user_id": user_id})
+
+
+async def search_quotes(db, text: str, language: str = None, category_id: str = None,
+                        user_id: str = None, skip: int = 0, limit: int = 20, query_language: str = None):
+    """Return quotes matching `text`, most relevant first.
+
+    The query is stemmed as `query_language` (the caller's language, defaulting to
+    the `language` filter); without either it is matched unstemmed.
+    """
+    query_language = query_language or language
+    terms = analyze(text, query_language)
+    if not terms:
+        return []
+    query = {"$text": {"$search": " ".join(terms), "$language": text_language(query_language)}}
+    if language:
+        query["language"] = language
+    if category_id:
+        query["category_id"] = category_id
+    if user_id:
+        query["user_id"] = user_id
+
+    score = {"$meta": "textScore"}
+    hits = await db[COLLECTION].find(query, {"_id": 0, "quote_id": 1, "score": score}) \
+        .sort([("score", score)]).skip(skip).limit(limit).to_list(limit)
+    ids = [h["quote_id"] for h in hits]
+    if not ids:
+        return []
+
+    quotes = await db.quotes.find({"id": {"$in": ids}}, {"_id": 0}).to_list(len(ids))
+    by_id = {q["id"]: q for q in quotes}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+async def reindex(db, batch_size: int = 1000):
+    """Rebuild every search document from the quotes collection."""
+    total = 0
+    batch = []
+    async for quote in db.quotes.find({}, {"_id": 0, "id": 1, "user_id": 1, "category_id": 1,
+                                          "language": 1, "content": 1, "author": 1, "tags": 1}):
+        batch.append(UpdateOne({"quote_id": quote["id"]}, {"$set": search_document(quote)}, upsert=True))
+        if len(batch) >= batch_size:
+            await db[COLLECTION].bulk_write(batch, ordered=False)
+            total += len(batch)
+            batch = []
+    if batch:
+        await db[COLLECTION].bulk_write(batch, ordered=False)
+        total += len(batch)
+    return total
+
+
+async def main(command: str):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from indexes import ensure_indexes
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    if command == "reindex":
+        await ensure_indexes(db)
+        count = await reindex(db)
+        print(f"Indexed {count} quotes")
+    else:
+        print(f"Unknown command: {command}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "reindex"))
@@ -0,0 +1,160 @@
+"""
+Reconciliation of denormalized counters.
+
+Counters such as `users.followers_count` or `quotes.likes_count` are kept up
+to date with scattered $inc updates and can drift. This recomputes them from
+the rows they count (follows, likes, saves, quotes) and writes corrections.
+
+Every counter update goes through `counter_update`, which also stamps
+`counters_touched_at`; an incremental run only checks entities touched since
+the previous run, a full run checks everything. Corrections are conditional
+on the value that was compared, so a concurrent $inc is never overwritten
+(the entity is touched again and picked up by the next run).
+
+Drift from a row written (a like, a follow) whose $inc then failed leaves no
+stamp, so only a full run finds it. An incremental run therefore becomes a
+full one when the last full run is older than FULL_EVERY.
+
+    python reconcile.py [incremental|full]
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+RUNS_COLLECTION = "reconcile_runs"
+
+# Touched timestamps come from the database clock; overlap runs to absorb skew
+OVERLAP = timedelta(minutes=5)
+
+# (collection holding the counter, counter field, source collection, source key)
+COUNTERS = [
+    ("users", "followers_count", "follows", "following_id"),
+    ("users", "following_count", "follows", "follower_id"),
+    ("users", "quotes_count", "quotes", "user_id"),
+    ("quotes", "likes_count", "likes", "quote_id"),
+    ("quotes", "saves_count", "saves", "quote_id"),
+    ("categories", "quotes_count", "quotes", "category_id"),
+]
+
+SAMPLE_SIZE = 10
+
+# Longest an unstamped drift can go unrepaired by scheduled incremental runs
+FULL_EVERY = timedelta(days=1)
+
+
+def counter_update(**deltas) -> dict:
+    """Update document applying counter deltas and marking the entity for reconciliation."""
+    return {"$inc": deltas, "$currentDate": {"counters_touched_at": True}}
+
+
+async def actual_counts(db, source: str, key: str, ids: list) -> dict:
+    counts = {}
+    async for row in db[source].aggregate([
+        {"$match": {key: {"$in": ids}}},
+        {"$group": {"_id": f"${key}", "count": {"$sum": 1}}}
+    ]):
+        counts[row["_id"]] = row["count"]
+    return counts
+
+
+async def reconcile_collection(db, collection: str, since=None, batch_size: int = 1000) -> dict:
+    """Check every counter held by `collection`; returns drift stats per counter field."""
+    specs = [c for c in COUNTERS if c[0] == collection]
+    report = {field: {"checked": 0, "drifted": 0, "total_drift": 0, "sample": []} for _, field, _, _ in specs}
+    projection = {"_id": 1, "id": 1, **{field: 1 for _, field, _, _ in specs}}
+
+    query = {"counters_touched_at": {"$gte": since}} if since else {}
+    last_id = None
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query["_id"] = {"$gt": last_id}
+        docs = await db[collection].find(batch_query, projection).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+        ids = [d["id"] for d in docs]
+
+        fixes = []
+        for _, field, source, key in specs:
+            counts = await actual_counts(db, source, key, ids)
+            stats = report[field]
+            stats["checked"] += len(docs)
+            for doc in docs:
+                stored = doc.get(field, 0)
+                actual = counts.get(doc["id"], 0)
+                if stored == actual:
+                    continue
+                stats["drifted"] += 1
+                stats["total_drift"] += actual - stored
+                if len(stats["sample"]) < SAMPLE_SIZE:
+                    stats["sample"].append({"id": doc["id"], "stored": stored, "actual": actual})
+                fixes.append(UpdateOne({"_id": doc["_id"], field: doc.get(field)}, {"$set": {field: actual}}))
+
+        if fixes:
+            await db[collection].bulk_write(fixes, ordered=False)
+    return report
+
+
+async def run(db, full: bool = False, batch_size: int = 1000) -> dict:
+    """Reconcile every counter; incremental unless `full`, there is no previous run or the last full one is too old."""
+    started_at = datetime.now(timezone.utc)
+    since = None
+    if not full:
+        last = await db[RUNS_COLLECTION].find_one({"status": "done"}, {"_id": 0}, sort=[("started_at", -1)])
+        last_full = await db[RUNS_COLLECTION].find_one(
+            {"status": "done", "mode": "full"}, {"_id": 0, "started_at": 1}, sort=[("started_at", -1)]
+        )
+        if last and last_full and last_full["started_at"] > started_at - FULL_EVERY:
+            since = last["started_at"] - OVERLAP
+
+    drift = {}
+    for collection in dict.fromkeys(c[0] for c in COUNTERS):
+        for field, stats in (await reconcile_collection(db, collection, since, batch_size)).items():
+            drift[f"{collection}.{field}"] = stats
+
+    result = {
+        "mode": "incremental" if since else "full",
+        "since": since,
+        "started_at": started_at,
+        "finished_at": datetime.now(timezone.utc),
+        "status": "done",
+        "drift": drift,
+    }
+    await db[RUNS_COLLECTION].insert_one(dict(result))
+    return result
+
+
+async def reconcile_job(db, job: dict, progress):
+    result = await run(db, full=job["params"].get("full", False))
+    await progress(mode=result["mode"], drifted={k: v["drifted"] for k, v in result["drift"].items()})
+
+
+async def main(mode: str):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from indexes import ensure_indexes
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+
+    if mode in ("incremental", "full"):
+        await ensure_indexes(db)
+        result = await run(db, full=mode == "full")
+        print(f"{result['mode'].capitalize()} run")
+        for counter, stats in result["drift"].items():
+            print(f"  {counter}: {stats['checked']} checked, {stats['drifted']} drifted, net drift {stats['total_drift']:+d}")
+            for s in stats["sample"]:
+                print(f"    {s['id']}: stored {s['stored']}, actual {s['actual']}")
+    else:
+        print(f"Unknown mode: {mode}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "incremental"))
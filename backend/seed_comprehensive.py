@@ -397,7 +397,7 @@ async def seed_database():
         "quotes_count": 0,
         "score": 150,
         "is_admin": False,
-        "created_at": (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+        "created_at": (datetime.now(timezone.utc) - timedelta(days=30))
     }
     await db.users.update_one(
         {"username": "@quotelover"},
@@ -419,7 +419,7 @@ async def seed_database():
             "translations": cat_data["translations"],
             "parent_id": None,
             "quotes_count": 0,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         }
         await db.categories.insert_one(category)
         category_map[cat_data["slug"]] = cat_id
@@ -449,7 +449,7 @@ async def seed_database():
             "saves_count": saves,
             "views_count": views,
             "shares_count": 0,
-            "created_at": (datetime.now(timezone.utc) - timedelta(days=created_days_ago)).isoformat()
+            "created_at": (datetime.now(timezone.utc) - timedelta(days=created_days_ago))
         }
         await db.quotes.insert_one(quote)
         
@@ -480,8 +480,8 @@ async def seed_database():
             "language": "en",
             "country": "United States",
             "published": True,
-            "created_at": (datetime.now(timezone.utc) - timedelta(days=20 - i*5)).isoformat(),
-            "updated_at": (datetime.now(timezone.utc) - timedelta(days=20 - i*5)).isoformat()
+            "created_at": (datetime.now(timezone.utc) - timedelta(days=20 - i*5)),
+            "updated_at": (datetime.now(timezone.utc) - timedelta(days=20 - i*5))
         }
         await db.blogs.insert_one(blog)
     
@@ -492,8 +492,8 @@ async def seed_database():
             "id": str(uuid.uuid4()),
             "language_code": lang_code,
             "translations": translations,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc),
+            "updated_at": datetime.now(timezone.utc)
         }
         await db.site_translations.update_one(
             {"language_code": lang_code},
@@ -114,7 +114,7 @@ async def seed_database():
             "parent_id": None,
             "icon": cat_data["icon"],
             "quotes_count": 0,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         }
         await db.categories.insert_one(cat)
         category_ids.append(cat["id"])
@@ -142,7 +142,7 @@ async def seed_database():
             "quotes_count": 0,
             "score": random.randint(100, 1000),
             "is_admin": False,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         }
         await db.users.insert_one(user)
         user_ids.append(user["id"])
@@ -165,7 +165,7 @@ async def seed_database():
             "saves_count": random.randint(2, 100),
             "views_count": random.randint(50, 1000),
             "shares_count": random.randint(1, 50),
-            "created_at": (datetime.now(timezone.utc) - timedelta(days=random.randint(0, 30))).isoformat()
+            "created_at": (datetime.now(timezone.utc) - timedelta(days=random.randint(0, 30)))
         }
         await db.quotes.insert_one(quote)
         
@@ -188,8 +188,8 @@ async def seed_database():
             "excerpt": blog_data["excerpt"],
             "featured_image": blog_data["featured_image"],
             "published": True,
-            "created_at": (datetime.now(timezone.utc) - timedelta(days=random.randint(1, 15))).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat()
+            "created_at": (datetime.now(timezone.utc) - timedelta(days=random.randint(1, 15))),
+            "updated_at": datetime.now(timezone.utc)
         }
         await db.blogs.insert_one(blog)
     print(f"Created {len(sample_blogs)} blogs")
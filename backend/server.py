@@ -1,10 +1,13 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
 import os
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr, ConfigDict
@@ -15,25 +18,48 @@ import jwt
 from passlib.context import CryptContext
 import phonenumbers
 import base64
-import re
 import shutil
-import aiofiles
+
+from indexes import ensure_indexes
+import leaderboard
+import unread
+import broadcasts
+import cascades
+import jobs
+import reconcile
+import trending
+import site_translations
+import uploads
+import images
+from uploads import UPLOAD_DIR, UploadSizeLimit, store_image
+from reconcile import counter_update
+from cache import LoadingCache, TTLCache
+from category_index import CategoryIndex
+from conversations import conversation_key, mark_read, with_read_flags
+from compression import CompressionMiddleware, CompressionStats
+from fastjson import FastJSONResponse, projector, respond
+from pagination import find_page, page_response
+from topk import TopKLists
+from viewbuffer import ViewCounter
+from quote_search import index_quote, search_quotes, unindex_quote
+from pubsub import ConnectionManager, create_broker
+from static_files import UploadFiles
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # Create uploads directory
-UPLOAD_DIR = ROOT_DIR / 'uploads'
 UPLOAD_DIR.mkdir(exist_ok=True)
 (UPLOAD_DIR / 'avatars').mkdir(exist_ok=True)
 (UPLOAD_DIR / 'backgrounds').mkdir(exist_ok=True)
 (UPLOAD_DIR / 'blogs').mkdir(exist_ok=True)
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 10 * 1024 * 1024))
 
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -43,6 +69,90 @@ SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-product
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60
 
+# Authenticated users by id; routes that modify a user invalidate their entry
+user_cache = TTLCache(
+    maxsize=int(os.environ.get('USER_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('USER_CACHE_TTL', 60))
+)
+
+# Assembled /api/home payloads by language; cleared when the content they show changes
+home_cache = LoadingCache(maxsize=64, ttl=float(os.environ.get('HOME_CACHE_TTL', 30)))
+
+# First pages of the most liked/saved/viewed tabs, served from memory
+discover_lists = TopKLists(
+    db,
+    k=int(os.environ.get('DISCOVER_TOP_K', 100)),
+    refresh_interval=float(os.environ.get('DISCOVER_REFRESH_INTERVAL', 60))
+)
+
+# Quote views are buffered in memory and flushed in bulk
+view_counter = ViewCounter(
+    db,
+    flush_interval=float(os.environ.get('VIEW_FLUSH_INTERVAL', 5)),
+    max_keys=int(os.environ.get('VIEW_BUFFER_MAX_KEYS', 10000)),
+    on_flush=discover_lists.observe_views
+)
+
+# Real-time events: routes publish through the broker, each worker pushes to its own sockets
+broker = create_broker(os.environ.get('PUBSUB_BACKEND', 'memory'), db)
+connections = ConnectionManager(queue_size=int(os.environ.get('WS_QUEUE_SIZE', 100)))
+
+# Site translations served from memory; updates are announced over the broker
+translation_bundles = site_translations.TranslationBundles(
+    db, refresh_interval=float(os.environ.get('TRANSLATIONS_REFRESH_INTERVAL', 300))
+)
+
+# Every category in memory, reloaded on admin edits and periodically for quotes_count
+category_index = CategoryIndex(db, refresh_interval=float(os.environ.get('CATEGORY_REFRESH_INTERVAL', 60)))
+
+# Jobs that write user counters drop the cached users afterwards
+async def delete_user_job(db, job: dict, progress):
+    await cascades.delete_user(db, job, progress)
+    # Everyone the user followed or was followed by has new counts
+    user_cache.clear()
+
+async def delete_quote_job(db, job: dict, progress):
+    await cascades.delete_quote(db, job, progress)
+    user_cache.invalidate(job["params"]["quote"]["user_id"])
+
+async def reconcile_job(db, job: dict, progress):
+    await reconcile.reconcile_job(db, job, progress)
+    user_cache.clear()
+
+# Durable background work: cascading deletes and broadcast fan-out
+job_worker = jobs.JobWorker(
+    db,
+    {
+        "delete_user": delete_user_job,
+        "delete_quote": delete_quote_job,
+        "broadcast_fan_out": broadcasts.fan_out,
+        "reconcile_counters": reconcile_job,
+        "uploads_gc": uploads.gc_job,
+        "trending_maintenance": trending.maintenance_job,
+    },
+    poll_interval=float(os.environ.get('JOB_POLL_INTERVAL', 1)),
+    lease_seconds=float(os.environ.get('JOB_LEASE_SECONDS', 60))
+)
+
+# Recurring jobs, every *_INTERVAL seconds (0 disables one): incremental counter
+# reconciliation, removal of orphaned upload files and trending score upkeep
+RECONCILE_INTERVAL = float(os.environ.get('RECONCILE_INTERVAL', 3600))
+UPLOAD_GC_INTERVAL = float(os.environ.get('UPLOAD_GC_INTERVAL', 86400))
+TRENDING_MAINTENANCE_INTERVAL = float(os.environ.get('TRENDING_MAINTENANCE_INTERVAL', 3600))
+job_scheduler = jobs.JobScheduler(
+    db,
+    {
+        job_type: (interval, params)
+        for job_type, interval, params in (
+            ("reconcile_counters", RECONCILE_INTERVAL, {"full": False}),
+            ("uploads_gc", UPLOAD_GC_INTERVAL, {}),
+            ("trending_maintenance", TRENDING_MAINTENANCE_INTERVAL, {}),
+        )
+        if interval > 0
+    },
+    on_enqueue=job_worker.notify
+)
+
 # ============= MODELS =============
 
 class User(BaseModel):
@@ -56,6 +166,7 @@ class User(BaseModel):
     full_name: Optional[str] = None
     bio: Optional[str] = None
     avatar: Optional[str] = None
+    avatar_variants: Optional[dict] = None
     country: Optional[str] = None
     country_code: Optional[str] = None
     phone: Optional[str] = None
@@ -96,6 +207,7 @@ class UserProfile(BaseModel):
     full_name: Optional[str] = None
     bio: Optional[str] = None
     avatar: Optional[str] = None
+    avatar_variants: Optional[dict] = None
     country: Optional[str] = None
     country_code: Optional[str] = None
     phone: Optional[str] = None
@@ -159,6 +271,7 @@ class Message(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     sender_id: str
     receiver_id: str
+    conversation_id: Optional[str] = None
     content: str
     read: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -193,6 +306,7 @@ class BackgroundImage(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     type: str  # 'story' or 'post'
     url: str
+    variants: Optional[dict] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class AdminSettings(BaseModel):
@@ -213,6 +327,7 @@ class Blog(BaseModel):
     content: str
     excerpt: Optional[str] = None
     featured_image: Optional[str] = None
+    featured_image_variants: Optional[dict] = None
     language: str = "en"
     country: Optional[str] = None
     published: bool = True
@@ -254,6 +369,15 @@ class Notification(BaseModel):
     read: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class Broadcast(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    type: str
+    title: str
+    message: str
+    link: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
 class NotificationCreate(BaseModel):
     user_id: str
     type: str
@@ -333,6 +457,9 @@ class UserUpdate(BaseModel):
     score: Optional[int] = None
     is_admin: Optional[bool] = None
 
+# Shapes trusted user rows like UserProfile without validating them
+user_profile = projector(UserProfile)
+
 class UserSettingsUpdate(BaseModel):
     username: Optional[str] = None  # Can update username
     first_name: Optional[str] = None
@@ -362,7 +489,7 @@ def verify_token(token: str):
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
@@ -371,10 +498,15 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     user_id = payload.get("sub")
     if user_id is None:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
     user = await db.users.find_one({"id": user_id}, {"_id": 0})
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
-    return User(**user)
+    user = User(**user)
+    user_cache.set(user_id, user)
+    return user
 
 async def get_current_admin(current_user: User = Depends(get_current_user)):
     if not current_user.is_admin:
@@ -419,12 +551,11 @@ async def register(user_data: UserRegister):
     )
     
     doc = user.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.users.insert_one(doc)
     
     token = create_access_token({"sub": user.id})
     
-    return {"token": token, "user": UserProfile(**user.model_dump())}
+    return respond({"token": token, "user": user_profile(doc)})
 
 @api_router.post("/auth/login")
 async def login(credentials: UserLogin):
@@ -432,21 +563,16 @@ async def login(credentials: UserLogin):
     if not user_doc:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    if isinstance(user_doc['created_at'], str):
-        user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
-    
-    user = User(**user_doc)
-    
-    if not pwd_context.verify(credentials.password, user.password_hash):
+    if not pwd_context.verify(credentials.password, user_doc.get("password_hash", "")):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    token = create_access_token({"sub": user.id})
+    token = create_access_token({"sub": user_doc["id"]})
     
-    return {"token": token, "user": UserProfile(**user.model_dump())}
+    return respond({"token": token, "user": user_profile(user_doc)})
 
 @api_router.get("/auth/me", response_model=UserProfile)
 async def get_me(current_user: User = Depends(get_current_user)):
-    return UserProfile(**current_user.model_dump())
+    return respond(user_profile(current_user.model_dump()))
 
 # ============= USER ROUTES =============
 
@@ -455,9 +581,7 @@ async def get_user(user_id: str):
     user = await db.users.find_one({"id": user_id}, {"_id": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    if isinstance(user['created_at'], str):
-        user['created_at'] = datetime.fromisoformat(user['created_at'])
-    return UserProfile(**user)
+    return respond(user_profile(user))
 
 @api_router.put("/users/profile")
 async def update_profile(full_name: Optional[str] = None, bio: Optional[str] = None, 
@@ -469,8 +593,10 @@ async def update_profile(full_name: Optional[str] = None, bio: Optional[str] = N
         update_data['bio'] = bio
     if avatar is not None:
         update_data['avatar'] = avatar
+        update_data['avatar_variants'] = await images.generate(avatar)
     
     await db.users.update_one({"id": current_user.id}, {"$set": update_data})
+    user_cache.invalidate(current_user.id)
     return {"message": "Profile updated"}
 
 # ============= QUOTE ROUTES =============
@@ -488,19 +614,23 @@ async def create_quote(quote_data: QuoteCreate, current_user: User = Depends(get
     )
     
     doc = quote.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.quotes.insert_one(doc)
     
-    await db.users.update_one({"id": current_user.id}, {"$inc": {"quotes_count": 1}})
+    await db.users.update_one({"id": current_user.id}, counter_update(quotes_count=1))
+    user_cache.invalidate(current_user.id)
     if quote_data.category_id:
-        await db.categories.update_one({"id": quote_data.category_id}, {"$inc": {"quotes_count": 1}})
+        await db.categories.update_one({"id": quote_data.category_id}, counter_update(quotes_count=1))
+    await leaderboard.record(db, current_user.id, quote.created_at, quotes=1)
+    await trending.record(db, quote.id, quote.language, trending.NEW_QUOTE_WEIGHT)
+    await index_quote(db, doc)
+    home_cache.clear()
     
     return quote
 
 @api_router.get("/quotes")
 async def get_quotes(skip: int = 0, limit: int = 20, category_id: Optional[str] = None, 
                     search: Optional[str] = None, user_id: Optional[str] = None,
-                    language: Optional[str] = None):
+                    language: Optional[str] = None, cursor: Optional[str] = None):
     query = {}
     if category_id:
         query['category_id'] = category_id
@@ -513,35 +643,21 @@ async def get_quotes(skip: int = 0, limit: int = 20, category_id: Optional[str]
             query['language'] = language
     
     if search:
-        search_condition = {
-            '$or': [
-                {'content': {'$regex': search, '$options': 'i'}},
-                {'author': {'$regex': search, '$options': 'i'}},
-                {'tags': {'$in': [re.compile(search, re.IGNORECASE)]}}
-            ]
-        }
-        # Add search condition
-        if 'language' in query:
-            # Keep language filter and add search
-            query['$and'] = [{'language': query.pop('language')}, search_condition]
-        else:
-            query.update(search_condition)
+        # Relevance ordered, so paged by offset only
+        quotes = await search_quotes(db, search, language=query.get('language'), category_id=category_id,
+                                     user_id=user_id, skip=skip, limit=limit, query_language=language)
+        return respond(page_response(quotes, None, cursor))
     
-    quotes = await db.quotes.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
-    for q in quotes:
-        if isinstance(q['created_at'], str):
-            q['created_at'] = datetime.fromisoformat(q['created_at'])
-    return quotes
+    quotes, next_cursor = await find_page(db.quotes, query, "created_at", limit, skip=skip, cursor=cursor)
+    return respond(page_response(quotes, next_cursor, cursor))
 
 @api_router.get("/quotes/{quote_id}")
 async def get_quote(quote_id: str):
     quote = await db.quotes.find_one({"id": quote_id}, {"_id": 0})
     if not quote:
         raise HTTPException(status_code=404, detail="Quote not found")
-    if isinstance(quote['created_at'], str):
-        quote['created_at'] = datetime.fromisoformat(quote['created_at'])
     
-    await db.quotes.update_one({"id": quote_id}, {"$inc": {"views_count": 1}})
+    view_counter.add(quote)
     return quote
 
 @api_router.delete("/quotes/{quote_id}")
@@ -552,11 +668,18 @@ async def delete_quote(quote_id: str, current_user: User = Depends(get_current_u
     if quote['user_id'] != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    await db.quotes.delete_one({"id": quote_id})
-    await db.users.update_one({"id": quote['user_id']}, {"$inc": {"quotes_count": -1}})
-    if quote.get('category_id'):
-        await db.categories.update_one({"id": quote['category_id']}, {"$inc": {"quotes_count": -1}})
-    
+    result = await db.quotes.delete_one({"id": quote_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Quote not found")
+    await unindex_quote(db, quote_id)
+    discover_lists.discard(quote_id=quote_id)
+    home_cache.clear()
+    # Counters and likes/saves are cleaned up by the job
+    job = await enqueue_job("delete_quote", {"quote": quote})
+    
+    # Job status is an admin route, so only admins get the id to follow it
+    if current_user.is_admin:
+        return {"message": "Quote deleted", "job_id": job['id']}
     return {"message": "Quote deleted"}
 
 # ============= CATEGORY ROUTES =============
@@ -577,27 +700,30 @@ async def create_category(category_data: CategoryCreate, current_user: User = De
     )
     
     doc = category.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.categories.insert_one(doc)
+    await categories_changed()
+    home_cache.clear()
     return category
 
+async def categories_changed():
+    # Reload here right away, and on the other workers through the broker
+    await category_index.load()
+    await publish_event(CategoryIndex.TOPIC, {})
+
 @api_router.get("/categories")
 async def get_categories(parent_id: Optional[str] = None):
-    query = {"parent_id": parent_id}
-    categories = await db.categories.find(query, {"_id": 0}).sort("name", 1).to_list(1000)
-    for c in categories:
-        if isinstance(c['created_at'], str):
-            c['created_at'] = datetime.fromisoformat(c['created_at'])
-    return categories
+    return respond(category_index.children(parent_id))
+
+@api_router.get("/categories/tree")
+async def get_category_tree(language: Optional[str] = None):
+    return Response(category_index.tree(language), media_type="application/json")
 
 @api_router.get("/categories/{category_id}")
 async def get_category(category_id: str):
-    category = await db.categories.find_one({"id": category_id}, {"_id": 0})
+    category = category_index.get(category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
-    if isinstance(category['created_at'], str):
-        category['created_at'] = datetime.fromisoformat(category['created_at'])
-    return category
+    return respond(category)
 
 # Category Translation Routes
 @api_router.put("/admin/categories/{category_id}/translations")
@@ -622,11 +748,13 @@ async def update_category_translation(
         {"id": category_id},
         {"$set": {"translations": translations}}
     )
+    await categories_changed()
+    home_cache.clear()
     return {"message": "Translation updated", "translations": translations}
 
 @api_router.get("/categories/{category_id}/translations")
 async def get_category_translations(category_id: str):
-    category = await db.categories.find_one({"id": category_id}, {"_id": 0})
+    category = category_index.get(category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     return {
@@ -638,35 +766,59 @@ async def get_category_translations(category_id: str):
 
 # ============= LIKE/SAVE ROUTES =============
 
+async def toggle_row(collection, key: dict, doc: dict):
+    """Insert `doc`, or delete the row matching `key` if it already exists.
+
+    Relies on the unique index over `key`. Returns (active, row): whether the
+    row exists afterwards and the row this call created or removed (None if
+    it changed nothing), so counters only move when the write actually took
+    effect.
+    """
+    try:
+        await collection.insert_one(doc)
+        return True, doc
+    except DuplicateKeyError:
+        removed = await collection.find_one_and_delete(key, projection={"_id": 0})
+        return False, removed
+
+async def inc_quote_counter(quote_id: str, field: str, amount: int, at: datetime = None):
+    # Returns the author, creation time and language for the leaderboard bucket and trending score
+    quote = await db.quotes.find_one_and_update(
+        {"id": quote_id},
+        counter_update(**{field: amount}),
+        projection={"_id": 0, "user_id": 1, "created_at": 1, "language": 1, field: 1}
+    )
+    if quote:
+        discover_lists.observe(field, quote_id, quote.get('language'), amount, value=quote.get(field, 0) + amount)
+        bucket_field = {"likes_count": "likes", "saves_count": "saves"}[field]
+        await leaderboard.record(db, quote['user_id'], quote['created_at'], **{bucket_field: amount})
+        # An unlike or unsave takes back exactly what the like or save added, at its own time
+        weight = {"likes_count": trending.LIKE_WEIGHT, "saves_count": trending.SAVE_WEIGHT}[field]
+        await trending.record(db, quote_id, quote.get('language'), weight * amount, at)
+
 @api_router.post("/quotes/{quote_id}/like")
 async def like_quote(quote_id: str, current_user: User = Depends(get_current_user)):
-    existing = await db.likes.find_one({"user_id": current_user.id, "quote_id": quote_id}, {"_id": 0})
-    if existing:
-        await db.likes.delete_one({"user_id": current_user.id, "quote_id": quote_id})
-        await db.quotes.update_one({"id": quote_id}, {"$inc": {"likes_count": -1}})
-        return {"liked": False}
-    
     like = Like(user_id=current_user.id, quote_id=quote_id)
-    doc = like.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.likes.insert_one(doc)
-    await db.quotes.update_one({"id": quote_id}, {"$inc": {"likes_count": 1}})
-    return {"liked": True}
+    liked, row = await toggle_row(
+        db.likes,
+        {"user_id": current_user.id, "quote_id": quote_id},
+        like.model_dump()
+    )
+    if row:
+        await inc_quote_counter(quote_id, "likes_count", 1 if liked else -1, row.get('created_at'))
+    return {"liked": liked}
 
 @api_router.post("/quotes/{quote_id}/save")
 async def save_quote(quote_id: str, current_user: User = Depends(get_current_user)):
-    existing = await db.saves.find_one({"user_id": current_user.id, "quote_id": quote_id}, {"_id": 0})
-    if existing:
-        await db.saves.delete_one({"user_id": current_user.id, "quote_id": quote_id})
-        await db.quotes.update_one({"id": quote_id}, {"$inc": {"saves_count": -1}})
-        return {"saved": False}
-    
     save = Save(user_id=current_user.id, quote_id=quote_id)
-    doc = save.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.saves.insert_one(doc)
-    await db.quotes.update_one({"id": quote_id}, {"$inc": {"saves_count": 1}})
-    return {"saved": True}
+    saved, row = await toggle_row(
+        db.saves,
+        {"user_id": current_user.id, "quote_id": quote_id},
+        save.model_dump()
+    )
+    if row:
+        await inc_quote_counter(quote_id, "saves_count", 1 if saved else -1, row.get('created_at'))
+    return {"saved": saved}
 
 @api_router.get("/quotes/{quote_id}/status")
 async def get_quote_status(quote_id: str, current_user: User = Depends(get_current_user)):
@@ -677,52 +829,37 @@ async def get_quote_status(quote_id: str, current_user: User = Depends(get_curre
 # ============= DISCOVER ROUTES =============
 
 @api_router.get("/discover/trending")
-async def get_trending():
-    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    trending_quotes = await db.quotes.find(
-        {"created_at": {"$gte": today.isoformat()}},
-        {"_id": 0}
-    ).sort("views_count", -1).limit(5).to_list(5)
-    
-    for q in trending_quotes:
-        if isinstance(q['created_at'], str):
-            q['created_at'] = datetime.fromisoformat(q['created_at'])
-    
-    return trending_quotes
+async def get_trending(language: Optional[str] = None, limit: int = 5):
+    return await trending.top_quotes(db, language, min(limit, 50))
+
+async def discover_page(metric: str, language: Optional[str], skip: int, limit: int, cursor: Optional[str]):
+    # Pages within the top K come from memory; cursors from either path are interchangeable
+    if not cursor:
+        page = await discover_lists.page(metric, language, skip, limit)
+        if page is not None:
+            return respond(page_response(*page, cursor))
+    query = {"language": language} if language else {}
+    query.update(discover_lists.exclusion())
+    quotes, next_cursor = await find_page(db.quotes, query, metric, limit, skip=skip, cursor=cursor)
+    return respond(page_response(quotes, next_cursor, cursor))
 
 @api_router.get("/discover/liked")
-async def get_most_liked(skip: int = 0, limit: int = 20):
-    quotes = await db.quotes.find({}, {"_id": 0}).sort("likes_count", -1).skip(skip).limit(limit).to_list(limit)
-    for q in quotes:
-        if isinstance(q['created_at'], str):
-            q['created_at'] = datetime.fromisoformat(q['created_at'])
-    return quotes
+async def get_most_liked(skip: int = 0, limit: int = 20, cursor: Optional[str] = None, language: Optional[str] = None):
+    return await discover_page("likes_count", language, skip, limit, cursor)
 
 @api_router.get("/discover/saved")
-async def get_most_saved(skip: int = 0, limit: int = 20):
-    quotes = await db.quotes.find({}, {"_id": 0}).sort("saves_count", -1).skip(skip).limit(limit).to_list(limit)
-    for q in quotes:
-        if isinstance(q['created_at'], str):
-            q['created_at'] = datetime.fromisoformat(q['created_at'])
-    return quotes
+async def get_most_saved(skip: int = 0, limit: int = 20, cursor: Optional[str] = None, language: Optional[str] = None):
+    return await discover_page("saves_count", language, skip, limit, cursor)
 
 @api_router.get("/discover/viewed")
-async def get_most_viewed(skip: int = 0, limit: int = 20):
-    quotes = await db.quotes.find({}, {"_id": 0}).sort("views_count", -1).skip(skip).limit(limit).to_list(limit)
-    for q in quotes:
-        if isinstance(q['created_at'], str):
-            q['created_at'] = datetime.fromisoformat(q['created_at'])
-    return quotes
+async def get_most_viewed(skip: int = 0, limit: int = 20, cursor: Optional[str] = None, language: Optional[str] = None):
+    return await discover_page("views_count", language, skip, limit, cursor)
 
 @api_router.get("/user/saved")
 async def get_user_saved(current_user: User = Depends(get_current_user)):
     saves = await db.saves.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
     quote_ids = [s['quote_id'] for s in saves]
     quotes = await db.quotes.find({"id": {"$in": quote_ids}}, {"_id": 0}).to_list(1000)
-    for q in quotes:
-        if isinstance(q['created_at'], str):
-            q['created_at'] = datetime.fromisoformat(q['created_at'])
     return quotes
 
 # ============= FOLLOW ROUTES =============
@@ -732,26 +869,69 @@ async def follow_user(user_id: str, current_user: User = Depends(get_current_use
     if user_id == current_user.id:
         raise HTTPException(status_code=400, detail="Cannot follow yourself")
     
-    existing = await db.follows.find_one({"follower_id": current_user.id, "following_id": user_id}, {"_id": 0})
-    if existing:
-        await db.follows.delete_one({"follower_id": current_user.id, "following_id": user_id})
-        await db.users.update_one({"id": current_user.id}, {"$inc": {"following_count": -1}})
-        await db.users.update_one({"id": user_id}, {"$inc": {"followers_count": -1}})
-        return {"following": False}
-    
     follow = Follow(follower_id=current_user.id, following_id=user_id)
-    doc = follow.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.follows.insert_one(doc)
-    await db.users.update_one({"id": current_user.id}, {"$inc": {"following_count": 1}})
-    await db.users.update_one({"id": user_id}, {"$inc": {"followers_count": 1}})
-    return {"following": True}
+    following, row = await toggle_row(
+        db.follows,
+        {"follower_id": current_user.id, "following_id": user_id},
+        follow.model_dump()
+    )
+    if row:
+        amount = 1 if following else -1
+        await db.users.bulk_write([
+            UpdateOne({"id": current_user.id}, counter_update(following_count=amount)),
+            UpdateOne({"id": user_id}, counter_update(followers_count=amount))
+        ], ordered=False)
+        user_cache.invalidate(current_user.id)
+        user_cache.invalidate(user_id)
+    return {"following": following}
 
 @api_router.get("/users/{user_id}/follow-status")
 async def get_follow_status(user_id: str, current_user: User = Depends(get_current_user)):
     following = await db.follows.find_one({"follower_id": current_user.id, "following_id": user_id}, {"_id": 0})
     return {"following": bool(following)}
 
+# ============= REALTIME =============
+
+async def dispatch_event(topic: str, event: dict, published_at: float):
+    # Cache invalidations for this worker; everything else goes to the sockets
+    if topic == site_translations.TOPIC:
+        translation_bundles.invalidate(event["language_code"])
+        return
+    if topic == CategoryIndex.TOPIC:
+        await category_index.load()
+        return
+    await connections.deliver(topic, event, published_at)
+
+async def publish_event(topic: str, event: dict):
+    # Push is best effort; clients still load the same data over HTTP
+    try:
+        await broker.publish(topic, event)
+    except Exception:
+        logger.exception("Failed to publish %s event", event.get("type"))
+
+@api_router.websocket("/ws")
+async def realtime_socket(websocket: WebSocket, token: str):
+    try:
+        user_id = verify_token(token).get("sub")
+    except HTTPException:
+        user_id = None
+    # A valid token can outlive its user
+    if user_id is None or not await db.users.find_one({"id": user_id}, {"_id": 1}):
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    connections.connect(user_id, websocket)
+    try:
+        while True:
+            # Clients only send keepalives
+            if await websocket.receive_text() == "ping":
+                await websocket.send_text("pong")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        connections.disconnect(user_id, websocket)
+
 # ============= MESSAGE ROUTES =============
 
 @api_router.post("/messages")
@@ -759,69 +939,99 @@ async def send_message(message_data: MessageCreate, current_user: User = Depends
     message = Message(
         sender_id=current_user.id,
         receiver_id=message_data.receiver_id,
+        conversation_id=conversation_key(current_user.id, message_data.receiver_id),
         content=message_data.content
     )
     
     doc = message.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.messages.insert_one(doc)
+    doc.pop('_id', None)
+    
+    # One summary document per conversation: latest message and unread count per participant
+    await db.conversations.update_one(
+        {"id": message.conversation_id},
+        {
+            "$set": {"last_message": doc, "last_message_at": message.created_at},
+            "$setOnInsert": {"participants": sorted([current_user.id, message_data.receiver_id])},
+            "$inc": {f"unread.{message_data.receiver_id}": 1}
+        },
+        upsert=True
+    )
+    await unread.increment(db, message_data.receiver_id, "messages")
+    event = {"type": "message", "message": jsonable_encoder(doc)}
+    await publish_event(f"user:{message_data.receiver_id}", event)
+    await publish_event(f"user:{current_user.id}", event)
     return message
 
+# Profile fields safe to embed in another user's responses
+PUBLIC_USER_FIELDS = [
+    "id", "username", "first_name", "last_name", "full_name", "bio", "avatar", "avatar_variants", "country", "language",
+    "followers_count", "following_count", "quotes_count", "score"
+]
+
 @api_router.get("/messages/conversations")
-async def get_conversations(current_user: User = Depends(get_current_user)):
+async def get_conversations(before: Optional[datetime] = None, limit: int = 20,
+                            current_user: User = Depends(get_current_user)):
+    match = {"participants": current_user.id}
+    # Older pages continue from the last message time of the previous page
+    if before:
+        match["last_message_at"] = {"$lt": before}
     pipeline = [
-        {"$match": {"$or": [{"sender_id": current_user.id}, {"receiver_id": current_user.id}]}},
-        {"$sort": {"created_at": -1}},
-        {"$group": {
-            "_id": {
-                "$cond": [
-                    {"$eq": ["$sender_id", current_user.id]},
-                    "$receiver_id",
-                    "$sender_id"
-                ]
-            },
-            "last_message": {"$first": "$$ROOT"}
+        {"$match": match},
+        {"$sort": {"last_message_at": -1}},
+        {"$limit": limit},
+        {"$addFields": {"partner_id": {"$arrayElemAt": [
+            {"$filter": {"input": "$participants", "as": "p", "cond": {"$ne": ["$$p", current_user.id]}}}, 0
+        ]}}},
+        {"$lookup": {
+            "from": "users",
+            "localField": "partner_id",
+            "foreignField": "id",
+            "as": "user"
+        }},
+        {"$unwind": "$user"},
+        {"$project": {
+            "_id": 0,
+            "last_message": 1,
+            "unread_count": {"$ifNull": [f"$unread.{current_user.id}", 0]},
+            **{f"user.{field}": 1 for field in PUBLIC_USER_FIELDS}
         }}
     ]
     
-    result = await db.messages.aggregate(pipeline).to_list(1000)
-    conversations = []
-    for r in result:
-        user_id = r['_id']
-        user = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
-        if user:
-            if isinstance(r['last_message']['created_at'], str):
-                r['last_message']['created_at'] = datetime.fromisoformat(r['last_message']['created_at'])
-            conversations.append({
-                "user": user,
-                "last_message": r['last_message']
-            })
-    return conversations
+    return await db.conversations.aggregate(pipeline).to_list(limit)
 
 @api_router.get("/messages/{user_id}")
-async def get_messages(user_id: str, current_user: User = Depends(get_current_user)):
-    messages = await db.messages.find({
-        "$or": [
-            {"sender_id": current_user.id, "receiver_id": user_id},
-            {"sender_id": user_id, "receiver_id": current_user.id}
-        ]
-    }, {"_id": 0}).sort("created_at", 1).to_list(1000)
-    
+async def get_messages(user_id: str, before: Optional[datetime] = None, limit: int = 50,
+                       current_user: User = Depends(get_current_user)):
+    conversation_id = conversation_key(current_user.id, user_id)
+    query = {"conversation_id": conversation_id}
+    if before:
+        query["created_at"] = {"$lt": before}
+    
+    # Newest page first from the (conversation_id, created_at) index, returned oldest first
+    messages = await db.messages.find(query, {"_id": 0}).sort("created_at", -1).limit(limit).to_list(limit)
+    messages.reverse()
+    
+    # Read up to the newest message on this page, not up to now: later ones weren't shown
+    if messages:
+        await mark_read(db, conversation_id, current_user.id, messages[-1]['created_at'])
+    conversation = await db.conversations.find_one({"id": conversation_id}, {"_id": 0, "last_read_at": 1})
+    if not conversation:
+        return messages
+    
+    partner_read_at = (conversation.get('last_read_at') or {}).get(user_id)
     for m in messages:
-        if isinstance(m['created_at'], str):
-            m['created_at'] = datetime.fromisoformat(m['created_at'])
-    
-    await db.messages.update_many(
-        {"sender_id": user_id, "receiver_id": current_user.id, "read": False},
-        {"$set": {"read": True}}
-    )
+        if m['receiver_id'] == current_user.id:
+            m['read'] = True
+        else:
+            m['read'] = partner_read_at is not None and m['created_at'] <= partner_read_at
     
     return messages
 
 @api_router.get("/messages/unread/count")
 async def get_unread_count(current_user: User = Depends(get_current_user)):
-    count = await db.messages.count_documents({"receiver_id": current_user.id, "read": False})
-    return {"count": count}
+    counts = await unread.get_counts(db, current_user.id)
+    return {"count": counts["messages"]}
 
 # ============= RANKING ROUTES =============
 
@@ -838,46 +1048,11 @@ async def get_ranking(period: str = "daily", language: Optional[str] = None, sea
     else:
         start = now.replace(hour=0, minute=0, second=0, microsecond=0)
     
-    # Filter users by language and search
-    user_query = {}
-    if language:
-        user_query['language'] = language
-    if search:
-        user_query['$or'] = [
-            {'username': {'$regex': search, '$options': 'i'}},
-            {'full_name': {'$regex': search, '$options': 'i'}}
-        ]
-    
-    users = await db.users.find(user_query, {"_id": 0}).to_list(1000)
-    
-    rankings = []
-    for user in users:
-        if isinstance(user['created_at'], str):
-            user['created_at'] = datetime.fromisoformat(user['created_at'])
-        
-        quotes = await db.quotes.find({
-            "user_id": user['id'],
-            "created_at": {"$gte": start.isoformat()}
-        }, {"_id": 0}).to_list(1000)
-        
-        total_views = sum(q.get('views_count', 0) for q in quotes)
-        total_likes = sum(q.get('likes_count', 0) for q in quotes)
-        total_saves = sum(q.get('saves_count', 0) for q in quotes)
-        quotes_count = len(quotes)
-        
-        score = (quotes_count * 10) + (total_views * 1) + (total_likes * 5) + (total_saves * 8)
-        
-        rankings.append({
-            "user": UserProfile(**user),
-            "quotes_count": quotes_count,
-            "total_views": total_views,
-            "total_likes": total_likes,
-            "total_saves": total_saves,
-            "score": score
-        })
-    
-    rankings.sort(key=lambda x: x['score'], reverse=True)
-    return rankings[:50]
+    # One aggregation over the materialized daily buckets
+    rankings = await leaderboard.top_users(db, start, language=language, search=search, limit=50)
+    for r in rankings:
+        r['user'] = user_profile(r['user'])
+    return respond(rankings)
 
 # ============= ADMIN ROUTES =============
 
@@ -886,17 +1061,14 @@ async def get_admin_settings(current_user: User = Depends(get_current_admin)):
     settings = await db.admin_settings.find_one({"id": "admin_settings"}, {"_id": 0})
     if not settings:
         settings = AdminSettings().model_dump()
-        settings['updated_at'] = settings['updated_at'].isoformat()
         await db.admin_settings.insert_one(settings)
-    if isinstance(settings.get('updated_at'), str):
-        settings['updated_at'] = datetime.fromisoformat(settings['updated_at'])
     return settings
 
 @api_router.put("/admin/settings")
 async def update_admin_settings(smtp_host: Optional[str] = None, smtp_port: Optional[int] = None,
                                smtp_user: Optional[str] = None, smtp_password: Optional[str] = None,
                                smtp_from: Optional[str] = None, current_user: User = Depends(get_current_admin)):
-    update_data = {"updated_at": datetime.now(timezone.utc).isoformat()}
+    update_data = {"updated_at": datetime.now(timezone.utc)}
     if smtp_host is not None:
         update_data['smtp_host'] = smtp_host
     if smtp_port is not None:
@@ -916,9 +1088,8 @@ async def add_background(type: str, url: str, current_user: User = Depends(get_c
     if type not in ['story', 'post']:
         raise HTTPException(status_code=400, detail="Type must be 'story' or 'post'")
     
-    bg = BackgroundImage(type=type, url=url)
+    bg = BackgroundImage(type=type, url=url, variants=await images.generate(url))
     doc = bg.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.backgrounds.insert_one(doc)
     return bg
 
@@ -928,9 +1099,6 @@ async def get_backgrounds(type: Optional[str] = None):
     if type:
         query['type'] = type
     backgrounds = await db.backgrounds.find(query, {"_id": 0}).to_list(1000)
-    for bg in backgrounds:
-        if isinstance(bg['created_at'], str):
-            bg['created_at'] = datetime.fromisoformat(bg['created_at'])
     return backgrounds
 
 @api_router.delete("/admin/backgrounds/{bg_id}")
@@ -952,6 +1120,50 @@ async def get_admin_stats(current_user: User = Depends(get_current_admin)):
         "messages_count": messages_count
     }
 
+@api_router.get("/admin/metrics")
+async def get_admin_metrics(current_user: User = Depends(get_current_admin)):
+    return {
+        "user_cache": user_cache.stats(),
+        "home_cache": home_cache.stats(),
+        "view_counter": view_counter.stats(),
+        "discover_lists": discover_lists.stats(),
+        "translations": translation_bundles.stats(),
+        "categories": category_index.stats(),
+        "realtime": {**connections.stats(), "published": broker.published},
+        "jobs": job_worker.stats(),
+        "compression": compression_stats.stats()
+    }
+
+# ============= BACKGROUND JOBS =============
+
+async def enqueue_job(job_type: str, params: dict):
+    job = await jobs.enqueue(db, job_type, params)
+    job_worker.notify()
+    return job
+
+@api_router.get("/admin/jobs")
+async def get_jobs(job_status: Optional[str] = Query(None, alias="status"), skip: int = 0, limit: int = 50,
+                   current_user: User = Depends(get_current_admin)):
+    query = {"status": job_status} if job_status else {}
+    return await db.jobs.find(query, {"_id": 0, "params": 0, "locked_until": 0}) \
+        .sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+
+@api_router.get("/admin/jobs/{job_id}")
+async def get_job(job_id: str, current_user: User = Depends(get_current_admin)):
+    job = await jobs.get(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@api_router.post("/admin/reconcile")
+async def start_reconcile(full: bool = False, current_user: User = Depends(get_current_admin)):
+    job = await enqueue_job("reconcile_counters", {"full": full})
+    return {"message": "Reconciliation queued", "job_id": job['id']}
+
+@api_router.get("/admin/reconcile/runs")
+async def get_reconcile_runs(limit: int = 10, current_user: User = Depends(get_current_admin)):
+    return await db.reconcile_runs.find({}, {"_id": 0}).sort("started_at", -1).limit(limit).to_list(limit)
+
 # ============= HOME PAGE DATA =============
 
 # ============= BLOG ROUTES =============
@@ -969,42 +1181,34 @@ async def create_blog(blog_data: BlogCreate, current_user: User = Depends(get_cu
         content=blog_data.content,
         excerpt=blog_data.excerpt,
         featured_image=blog_data.featured_image,
+        featured_image_variants=await images.generate(blog_data.featured_image),
         language=blog_data.language,
         country=blog_data.country,
         published=blog_data.published
     )
     
     doc = blog.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['updated_at'] = doc['updated_at'].isoformat()
     await db.blogs.insert_one(doc)
+    home_cache.clear()
     return blog
 
 @api_router.get("/blogs")
-async def get_blogs(skip: int = 0, limit: int = 20, published_only: bool = True, language: Optional[str] = None):
+async def get_blogs(skip: int = 0, limit: int = 20, published_only: bool = True, language: Optional[str] = None,
+                    cursor: Optional[str] = None):
     query = {"published": True} if published_only else {}
     
     # Language filtering: ONLY selected language (no fallback)
     if language:
         query['language'] = language
     
-    blogs = await db.blogs.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
-    for b in blogs:
-        if isinstance(b['created_at'], str):
-            b['created_at'] = datetime.fromisoformat(b['created_at'])
-        if isinstance(b['updated_at'], str):
-            b['updated_at'] = datetime.fromisoformat(b['updated_at'])
-    return blogs
+    blogs, next_cursor = await find_page(db.blogs, query, "created_at", limit, skip=skip, cursor=cursor)
+    return respond(page_response(blogs, next_cursor, cursor))
 
 @api_router.get("/blogs/{blog_id}")
 async def get_blog(blog_id: str):
     blog = await db.blogs.find_one({"id": blog_id}, {"_id": 0})
     if not blog:
         raise HTTPException(status_code=404, detail="Blog not found")
-    if isinstance(blog['created_at'], str):
-        blog['created_at'] = datetime.fromisoformat(blog['created_at'])
-    if isinstance(blog['updated_at'], str):
-        blog['updated_at'] = datetime.fromisoformat(blog['updated_at'])
     return blog
 
 @api_router.put("/admin/blogs/{blog_id}")
@@ -1014,11 +1218,13 @@ async def update_blog(blog_id: str, blog_data: BlogCreate, current_user: User =
         "content": blog_data.content,
         "excerpt": blog_data.excerpt,
         "featured_image": blog_data.featured_image,
+        "featured_image_variants": await images.generate(blog_data.featured_image),
         "published": blog_data.published,
-        "updated_at": datetime.now(timezone.utc).isoformat()
+        "updated_at": datetime.now(timezone.utc)
     }
     
     result = await db.blogs.update_one({"id": blog_id}, {"$set": update_data})
+    home_cache.clear()
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Blog not found")
     return {"message": "Blog updated"}
@@ -1026,6 +1232,7 @@ async def update_blog(blog_id: str, blog_data: BlogCreate, current_user: User =
 @api_router.delete("/admin/blogs/{blog_id}")
 async def delete_blog(blog_id: str, current_user: User = Depends(get_current_admin)):
     result = await db.blogs.delete_one({"id": blog_id})
+    home_cache.clear()
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Blog not found")
     return {"message": "Blog deleted"}
@@ -1034,6 +1241,9 @@ async def delete_blog(blog_id: str, current_user: User = Depends(get_current_adm
 
 @api_router.get("/home")
 async def get_home_data(language: Optional[str] = "en"):
+    return await home_cache.get_or_build(language, lambda: build_home_data(language))
+
+async def build_home_data(language: Optional[str]):
     # Get system settings for counts
     settings = await db.system_settings.find_one({"id": "system_settings"}, {"_id": 0})
     if not settings:
@@ -1045,46 +1255,31 @@ async def get_home_data(language: Optional[str] = "en"):
     blogs_count = settings.get('homepage_blogs_count', 4)
     
     # Trending quotes - ONLY selected language (no fallback)
-    week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-    quote_query = {
-        "created_at": {"$gte": week_ago.isoformat()},
-        "language": language
-    }
-    trending_quotes = await db.quotes.find(quote_query, {"_id": 0}).sort("views_count", -1).limit(quotes_count).to_list(quotes_count)
-    
-    # If no quotes from last week, get any recent quotes in selected language
-    if not trending_quotes:
-        quote_query = {"language": language}
-        trending_quotes = await db.quotes.find(quote_query, {"_id": 0}).sort("created_at", -1).limit(quotes_count).to_list(quotes_count)
-    
-    for q in trending_quotes:
-        if isinstance(q['created_at'], str):
-            q['created_at'] = datetime.fromisoformat(q['created_at'])
+    async def hot_quotes():
+        trending_quotes = await trending.top_quotes(db, language, quotes_count)
+        
+        # If nothing is trending, get any recent quotes in selected language
+        if not trending_quotes:
+            quote_query = {"language": language}
+            trending_quotes = await db.quotes.find(quote_query, {"_id": 0}).sort("created_at", -1).limit(quotes_count).to_list(quotes_count)
+        return trending_quotes
     
     # Trending categories
-    categories = await db.categories.find({}, {"_id": 0}).sort("quotes_count", -1).limit(categories_count).to_list(categories_count)
-    for c in categories:
-        if isinstance(c['created_at'], str):
-            c['created_at'] = datetime.fromisoformat(c['created_at'])
+    async def top_categories():
+        return category_index.top(categories_count)
     
     # Trending users - filtered by language
     user_query = {"language": language} if language else {}
-    users = await db.users.find(user_query, {"_id": 0, "password_hash": 0}).sort("followers_count", -1).limit(users_count).to_list(users_count)
-    for u in users:
-        if isinstance(u['created_at'], str):
-            u['created_at'] = datetime.fromisoformat(u['created_at'])
+    users_query = db.users.find(user_query, {"_id": 0, "password_hash": 0}).sort("followers_count", -1).limit(users_count).to_list(users_count)
     
     # Recent blogs - ONLY selected language (no fallback)
     blog_query = {
         "published": True,
         "language": language
     }
-    blogs = await db.blogs.find(blog_query, {"_id": 0}).sort("created_at", -1).limit(blogs_count).to_list(blogs_count)
-    for b in blogs:
-        if isinstance(b['created_at'], str):
-            b['created_at'] = datetime.fromisoformat(b['created_at'])
-        if isinstance(b['updated_at'], str):
-            b['updated_at'] = datetime.fromisoformat(b['updated_at'])
+    blogs_query = db.blogs.find(blog_query, {"_id": 0}).sort("created_at", -1).limit(blogs_count).to_list(blogs_count)
+    
+    trending_quotes, categories, users, blogs = await asyncio.gather(hot_quotes(), top_categories(), users_query, blogs_query)
     
     return {
         "trending_quotes": trending_quotes,
@@ -1098,9 +1293,6 @@ async def get_home_data(language: Optional[str] = "en"):
 @api_router.get("/languages")
 async def get_languages():
     languages = await db.languages.find({"enabled": True}, {"_id": 0}).to_list(None)
-    for lang in languages:
-        if isinstance(lang['created_at'], str):
-            lang['created_at'] = datetime.fromisoformat(lang['created_at'])
     return languages
 
 @api_router.post("/admin/languages")
@@ -1111,13 +1303,12 @@ async def create_language(lang_data: LanguageCreate, current_user: User = Depend
     
     language = Language(**lang_data.model_dump())
     doc = language.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.languages.insert_one(doc)
     return language
 
 @api_router.put("/admin/languages/{lang_id}")
 async def update_language(lang_id: str, lang_data: LanguageCreate, current_user: User = Depends(get_current_admin)):
-    update_data = {**lang_data.model_dump(), "updated_at": datetime.now(timezone.utc).isoformat()}
+    update_data = {**lang_data.model_dump(), "updated_at": datetime.now(timezone.utc)}
     result = await db.languages.update_one({"id": lang_id}, {"$set": update_data})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Language not found")
@@ -1134,52 +1325,85 @@ async def delete_language(lang_id: str, current_user: User = Depends(get_current
 
 @api_router.get("/notifications")
 async def get_notifications(current_user: User = Depends(get_current_user)):
-    notifications = await db.notifications.find(
-        {"user_id": current_user.id}, 
-        {"_id": 0}
-    ).sort("created_at", -1).limit(50).to_list(50)
-    for n in notifications:
-        if isinstance(n['created_at'], str):
-            n['created_at'] = datetime.fromisoformat(n['created_at'])
-    return notifications
+    notifications, broadcast_items = await asyncio.gather(
+        db.notifications.find({"user_id": current_user.id}, {"_id": 0}).sort("created_at", -1).limit(50).to_list(50),
+        broadcasts.visible_to(db, current_user.id, current_user.created_at, limit=50)
+    )
+    notifications.extend(broadcast_items)
+    notifications.sort(key=lambda n: n['created_at'], reverse=True)
+    return notifications[:50]
+
+@api_router.get("/notifications/unread/count")
+async def get_unread_notifications_count(current_user: User = Depends(get_current_user)):
+    counts = await unread.get_counts(db, current_user.id)
+    return {"count": counts["notifications"]}
+
+@api_router.get("/unread/counts")
+async def get_unread_counts(current_user: User = Depends(get_current_user)):
+    return await unread.get_counts(db, current_user.id)
+
+@api_router.put("/notifications/read-all")
+async def mark_all_notifications_read(current_user: User = Depends(get_current_user)):
+    result = await db.notifications.update_many(
+        {"user_id": current_user.id, "read": False},
+        {"$set": {"read": True}}
+    )
+    await unread.decrement(db, current_user.id, "notifications", result.modified_count)
+    # Broadcast badges are settled by mark_all_read itself
+    marked = result.modified_count + await broadcasts.mark_all_read(db, current_user.id, current_user.created_at)
+    return {"message": f"Marked {marked} notifications as read"}
 
 @api_router.put("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.notifications.update_one(
+    previous = await db.notifications.find_one_and_update(
         {"id": notification_id, "user_id": current_user.id},
-        {"$set": {"read": True}}
+        {"$set": {"read": True}},
+        projection={"_id": 0, "read": 1}
     )
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Notification not found")
+    if previous is None:
+        if not await broadcasts.set_marker(db, current_user.id, notification_id):
+            raise HTTPException(status_code=404, detail="Notification not found")
+    elif not previous.get('read'):
+        await unread.decrement(db, current_user.id, "notifications")
     return {"message": "Notification marked as read"}
 
+@api_router.delete("/notifications/{notification_id}")
+async def dismiss_notification(notification_id: str, current_user: User = Depends(get_current_user)):
+    deleted = await db.notifications.find_one_and_delete(
+        {"id": notification_id, "user_id": current_user.id},
+        projection={"_id": 0, "read": 1}
+    )
+    if deleted is None:
+        if not await broadcasts.set_marker(db, current_user.id, notification_id, dismissed=True):
+            raise HTTPException(status_code=404, detail="Notification not found")
+    elif not deleted.get('read'):
+        await unread.decrement(db, current_user.id, "notifications")
+    return {"message": "Notification dismissed"}
+
 @api_router.post("/admin/notifications/broadcast")
 async def broadcast_notification(notification: NotificationCreate, current_user: User = Depends(get_current_admin)):
-    # Send notification to all users
-    users = await db.users.find({}, {"_id": 0, "id": 1}).to_list(None)
-    notifications = []
-    for user in users:
-        notif = Notification(
-            user_id=user['id'],
-            type=notification.type,
-            title=notification.title,
-            message=notification.message,
-            link=notification.link
-        )
-        doc = notif.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
-        notifications.append(doc)
-    
-    if notifications:
-        await db.notifications.insert_many(notifications)
-    return {"message": f"Sent {len(notifications)} notifications"}
+    # Stored once and merged into every feed on read; only the unread badges are fanned out, in the background
+    broadcast = Broadcast(**notification.model_dump(exclude={"user_id"}))
+    doc = broadcast.model_dump()
+    doc['fanout'] = {"status": "running", "processed": 0}
+    await db.broadcasts.insert_one(doc)
+    job = await enqueue_job("broadcast_fan_out", {"broadcast_id": broadcast.id})
+    await publish_event("broadcast", {"type": "notification", "notification": jsonable_encoder(broadcast)})
+    return {"message": "Broadcast sent", "id": broadcast.id, "job_id": job['id']}
+
+@api_router.get("/admin/notifications/broadcasts")
+async def get_broadcasts(skip: int = 0, limit: int = 50, current_user: User = Depends(get_current_admin)):
+    # Includes fan-out progress: status, processed and total users
+    return await db.broadcasts.find({}, {"_id": 0, "fanout.last_user_oid": 0}) \
+        .sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
 
 @api_router.post("/notifications")
 async def create_notification(notification: NotificationCreate, current_user: User = Depends(get_current_user)):
     notif = Notification(**notification.model_dump())
     doc = notif.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.notifications.insert_one(doc)
+    await unread.increment(db, notif.user_id, "notifications")
+    await publish_event(f"user:{notif.user_id}", {"type": "notification", "notification": jsonable_encoder(notif)})
     return notif
 
 # ============= SETTINGS ROUTES =============
@@ -1190,20 +1414,19 @@ async def get_system_settings():
     if not settings:
         # Return default settings
         return SystemSettings().model_dump()
-    if isinstance(settings.get('updated_at'), str):
-        settings['updated_at'] = datetime.fromisoformat(settings['updated_at'])
     return settings
 
 @api_router.put("/admin/settings/system")
 async def update_system_settings(settings_data: SystemSettingsUpdate, current_user: User = Depends(get_current_admin)):
     update_data = {k: v for k, v in settings_data.model_dump().items() if v is not None}
-    update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_data['updated_at'] = datetime.now(timezone.utc)
     
     await db.system_settings.update_one(
         {"id": "system_settings"},
         {"$set": update_data},
         upsert=True
     )
+    home_cache.clear()
     return {"message": "Settings updated"}
 
 @api_router.put("/settings/user")
@@ -1224,8 +1447,12 @@ async def update_user_settings(settings_data: UserSettingsUpdate, current_user:
         if existing:
             raise HTTPException(status_code=400, detail="Username already taken")
     
+    if 'avatar' in update_data:
+        update_data['avatar_variants'] = await images.generate(update_data['avatar'])
+    
     if update_data:
         await db.users.update_one({"id": current_user.id}, {"$set": update_data})
+        user_cache.invalidate(current_user.id)
     
     return {"message": "User settings updated"}
 
@@ -1239,8 +1466,6 @@ async def get_share_data(quote_id: str):
     
     # Get user data
     user = await db.users.find_one({"id": quote['user_id']}, {"_id": 0, "password_hash": 0})
-    if isinstance(quote['created_at'], str):
-        quote['created_at'] = datetime.fromisoformat(quote['created_at'])
     
     return {
         "quote": quote,
@@ -1251,16 +1476,16 @@ async def get_share_data(quote_id: str):
 # ============= ADMIN USER MANAGEMENT =============
 
 @api_router.get("/admin/users")
-async def get_all_users(skip: int = 0, limit: int = 50, current_user: User = Depends(get_current_admin)):
-    users = await db.users.find({}, {"_id": 0, "password_hash": 0}).skip(skip).limit(limit).to_list(limit)
-    for u in users:
-        if isinstance(u['created_at'], str):
-            u['created_at'] = datetime.fromisoformat(u['created_at'])
-    return users
+async def get_all_users(skip: int = 0, limit: int = 50, cursor: Optional[str] = None,
+                        current_user: User = Depends(get_current_admin)):
+    users, next_cursor = await find_page(db.users, {}, "created_at", limit, skip=skip, cursor=cursor,
+                                         projection={"_id": 0, "password_hash": 0})
+    return respond(page_response(users, next_cursor, cursor))
 
 @api_router.put("/admin/users/{user_id}/score")
 async def update_user_score(user_id: str, score: int, current_user: User = Depends(get_current_admin)):
     result = await db.users.update_one({"id": user_id}, {"$set": {"score": score}})
+    user_cache.invalidate(user_id)
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     return {"message": "User score updated"}
@@ -1271,27 +1496,24 @@ async def delete_user(user_id: str, current_user: User = Depends(get_current_adm
         raise HTTPException(status_code=400, detail="Cannot delete yourself")
     
     result = await db.users.delete_one({"id": user_id})
+    user_cache.invalidate(user_id)
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Clean up user data
-    await db.quotes.delete_many({"user_id": user_id})
-    await db.messages.delete_many({"$or": [{"sender_id": user_id}, {"receiver_id": user_id}]})
-    await db.follows.delete_many({"$or": [{"follower_id": user_id}, {"following_id": user_id}]})
-    await db.likes.delete_many({"user_id": user_id})
-    await db.saves.delete_many({"user_id": user_id})
+    # Quotes, reactions, follows and messages are removed by the job, which also fixes other users' counters
+    job = await enqueue_job("delete_user", {"user_id": user_id})
+    discover_lists.discard(user_id=user_id)
+    home_cache.clear()
     
-    return {"message": "User deleted"}
+    return {"message": "User deleted", "job_id": job['id']}
 
 # ============= ADMIN MESSAGES MANAGEMENT =============
 
 @api_router.get("/admin/messages")
-async def get_all_messages(skip: int = 0, limit: int = 100, current_user: User = Depends(get_current_admin)):
-    messages = await db.messages.find({}, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
-    for m in messages:
-        if isinstance(m['created_at'], str):
-            m['created_at'] = datetime.fromisoformat(m['created_at'])
-    return messages
+async def get_all_messages(skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+                           current_user: User = Depends(get_current_admin)):
+    messages, next_cursor = await find_page(db.messages, {}, "created_at", limit, skip=skip, cursor=cursor)
+    return page_response(await with_read_flags(db, messages), next_cursor, cursor)
 
 @api_router.delete("/admin/messages/{message_id}")
 async def delete_message_admin(message_id: str, current_user: User = Depends(get_current_admin)):
@@ -1303,47 +1525,34 @@ async def delete_message_admin(message_id: str, current_user: User = Depends(get
 # ============= ADMIN QUOTES MANAGEMENT =============
 
 @api_router.get("/admin/quotes")
-async def get_all_quotes_admin(skip: int = 0, limit: int = 100, current_user: User = Depends(get_current_admin)):
-    quotes = await db.quotes.find({}, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
-    for q in quotes:
-        if isinstance(q['created_at'], str):
-            q['created_at'] = datetime.fromisoformat(q['created_at'])
-    return quotes
+async def get_all_quotes_admin(skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+                               current_user: User = Depends(get_current_admin)):
+    quotes, next_cursor = await find_page(db.quotes, {}, "created_at", limit, skip=skip, cursor=cursor)
+    return page_response(quotes, next_cursor, cursor)
 
 @api_router.delete("/admin/quotes/{quote_id}")
 async def delete_quote_admin(quote_id: str, current_user: User = Depends(get_current_admin)):
-    result = await db.quotes.delete_one({"id": quote_id})
-    if result.deleted_count == 0:
+    quote = await db.quotes.find_one_and_delete({"id": quote_id}, projection={"_id": 0})
+    if not quote:
         raise HTTPException(status_code=404, detail="Quote not found")
+    await unindex_quote(db, quote_id)
+    discover_lists.discard(quote_id=quote_id)
+    home_cache.clear()
+    job = await enqueue_job("delete_quote", {"quote": quote})
     
-    # Clean up related data
-    await db.likes.delete_many({"quote_id": quote_id})
-    await db.saves.delete_many({"quote_id": quote_id})
-    
-    return {"message": "Quote deleted"}
+    return {"message": "Quote deleted", "job_id": job['id']}
 
 # ============= FILE UPLOAD ENDPOINTS =============
 
 @api_router.post("/upload/avatar")
 async def upload_avatar(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
-    if not file.content_type.startswith('image/'):
-        raise HTTPException(status_code=400, detail="File must be an image")
-    
-    # Generate unique filename
-    ext = file.filename.split('.')[-1]
-    filename = f"{current_user.id}_{uuid.uuid4()}.{ext}"
-    filepath = UPLOAD_DIR / 'avatars' / filename
+    # The previous avatar file is left for the uploads GC
+    avatar_url = await store_image(file, 'avatars', UPLOAD_MAX_BYTES)
+    variants = await images.generate(avatar_url)
+    await db.users.update_one({"id": current_user.id}, {"$set": {"avatar": avatar_url, "avatar_variants": variants}})
+    user_cache.invalidate(current_user.id)
     
-    # Save file
-    async with aiofiles.open(filepath, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
-    
-    # Update user avatar
-    avatar_url = f"/uploads/avatars/{filename}"
-    await db.users.update_one({"id": current_user.id}, {"$set": {"avatar": avatar_url}})
-    
-    return {"avatar_url": avatar_url}
+    return {"avatar_url": avatar_url, "variants": variants}
 
 @api_router.post("/admin/upload/background")
 async def upload_background(
@@ -1351,27 +1560,14 @@ async def upload_background(
     type: str = Form(...),
     current_user: User = Depends(get_current_admin)
 ):
-    if not file.content_type.startswith('image/'):
-        raise HTTPException(status_code=400, detail="File must be an image")
-    
     if type not in ['story', 'post']:
         raise HTTPException(status_code=400, detail="Type must be 'story' or 'post'")
     
-    # Generate unique filename
-    ext = file.filename.split('.')[-1]
-    filename = f"bg_{type}_{uuid.uuid4()}.{ext}"
-    filepath = UPLOAD_DIR / 'backgrounds' / filename
-    
-    # Save file
-    async with aiofiles.open(filepath, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
+    bg_url = await store_image(file, 'backgrounds', UPLOAD_MAX_BYTES)
     
     # Create background record
-    bg_url = f"/uploads/backgrounds/{filename}"
-    bg = BackgroundImage(type=type, url=bg_url)
+    bg = BackgroundImage(type=type, url=bg_url, variants=await images.generate(bg_url))
     doc = bg.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.backgrounds.insert_one(doc)
     
     return bg
@@ -1381,20 +1577,9 @@ async def upload_blog_image(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_admin)
 ):
-    if not file.content_type.startswith('image/'):
-        raise HTTPException(status_code=400, detail="File must be an image")
-    
-    # Generate unique filename
-    ext = file.filename.split('.')[-1]
-    filename = f"blog_{uuid.uuid4()}.{ext}"
-    filepath = UPLOAD_DIR / 'blogs' / filename
-    
-    # Save file
-    async with aiofiles.open(filepath, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
-    
-    return {"image_url": f"/uploads/blogs/{filename}"}
+    image_url = await store_image(file, 'blogs', UPLOAD_MAX_BYTES)
+    # Rendered now so the blog saved with this image finds its variants already on disk
+    return {"image_url": image_url, "variants": await images.generate(image_url)}
 
 # ============= CATEGORY UPDATE ENDPOINT =============
 
@@ -1413,8 +1598,10 @@ async def update_category(
         raise HTTPException(status_code=400, detail="No data to update")
     
     result = await db.categories.update_one({"id": category_id}, {"$set": update_data})
+    home_cache.clear()
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Category not found")
+    await categories_changed()
     
     return {"message": "Category updated"}
 
@@ -1445,7 +1632,11 @@ async def update_user_admin(
     if not update_data:
         raise HTTPException(status_code=400, detail="No data to update")
     
+    if 'avatar' in update_data:
+        update_data['avatar_variants'] = await images.generate(update_data['avatar'])
+    
     result = await db.users.update_one({"id": user_id}, {"$set": update_data})
+    user_cache.invalidate(user_id)
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -1454,15 +1645,9 @@ async def update_user_admin(
 # ============= SITE TRANSLATIONS =============
 
 @api_router.get("/translations/{language_code}")
-async def get_site_translations(language_code: str):
-    translation = await db.site_translations.find_one({"language_code": language_code}, {"_id": 0})
-    if not translation:
-        return {"language_code": language_code, "translations": {}}
-    if isinstance(translation.get('created_at'), str):
-        translation['created_at'] = datetime.fromisoformat(translation['created_at'])
-    if isinstance(translation.get('updated_at'), str):
-        translation['updated_at'] = datetime.fromisoformat(translation['updated_at'])
-    return translation
+async def get_site_translations(language_code: str, request: Request, v: Optional[str] = None):
+    bundle = await translation_bundles.get(language_code)
+    return bundle.response(request.headers, version=v)
 
 @api_router.put("/admin/translations/{language_code}")
 async def update_site_translations(
@@ -1473,7 +1658,7 @@ async def update_site_translations(
     update_data = {
         "language_code": language_code,
         "translations": translation_data.translations,
-        "updated_at": datetime.now(timezone.utc).isoformat()
+        "updated_at": datetime.now(timezone.utc)
     }
     
     await db.site_translations.update_one(
@@ -1481,6 +1666,8 @@ async def update_site_translations(
         {"$set": update_data},
         upsert=True
     )
+    translation_bundles.invalidate(language_code)
+    await publish_event(site_translations.TOPIC, {"language_code": language_code})
     
     return {"message": "Translations updated"}
 
@@ -1519,10 +1706,7 @@ async def get_user_quotes(
         sort_field = "views_count"
     
     quotes = await db.quotes.find(query, {"_id": 0}).sort(sort_field, -1).to_list(1000)
-    for q in quotes:
-        if isinstance(q['created_at'], str):
-            q['created_at'] = datetime.fromisoformat(q['created_at'])
-    return quotes
+    return respond(quotes)
 
 # ============= USER LIKED QUOTES =============
 
@@ -1535,15 +1719,22 @@ async def get_user_liked_quotes(user_id: str):
         return []
     
     quotes = await db.quotes.find({"id": {"$in": quote_ids}}, {"_id": 0}).to_list(1000)
-    for q in quotes:
-        if isinstance(q['created_at'], str):
-            q['created_at'] = datetime.fromisoformat(q['created_at'])
-    return quotes
+    return respond(quotes)
 
 app.include_router(api_router)
 
 # Mount static files for uploads
-app.mount("/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
+app.mount("/uploads", UploadFiles(directory=str(UPLOAD_DIR)), name="uploads")
+
+compression_stats = CompressionStats()
+
+app.add_middleware(UploadSizeLimit, max_bytes=UPLOAD_MAX_BYTES)
+
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)),
+    stats=compression_stats,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -1561,6 +1752,15 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
 async def startup_db():
+    await ensure_indexes(db)
+    view_counter.start()
+    discover_lists.start()
+    await category_index.load()
+    category_index.start()
+    await broker.start(dispatch_event)
+    job_worker.start()
+    job_scheduler.start()
+    
     admin = await db.users.find_one({"username": "@admin"}, {"_id": 0})
     if not admin:
         admin_user = User(
@@ -1573,7 +1773,6 @@ async def startup_db():
             social_links={}
         )
         doc = admin_user.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
         await db.users.insert_one(doc)
         logger.info("Admin user created")
     
@@ -1606,11 +1805,21 @@ async def startup_db():
         for lang_data in default_languages:
             lang = Language(**lang_data, enabled=True)
             doc = lang.model_dump()
-            doc['created_at'] = doc['created_at'].isoformat()
             await db.languages.insert_one(doc)
         
         logger.info("Default languages created")
+    
+    await translation_bundles.warm()
+    translation_bundles.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await view_counter.stop()
+    await discover_lists.stop()
+    await category_index.stop()
+    await translation_bundles.stop()
+    await broker.stop()
+    await job_scheduler.stop()
+    await job_worker.stop()
+    images.shutdown()
     client.close()
\ No newline at end of file
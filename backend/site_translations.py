@@ -0,0 +1,148 @@
+"""
+In-memory site translation bundles for /api/translations/{code}.
+
+Each language's translations are serialized once, hashed and gzipped, so a
+request is answered from memory: 304 when the client's ETag matches, the
+precompressed body when it accepts gzip. The gzip and identity bodies carry
+their own strong ETags. The content hash doubles as the bundle version; a
+request carrying `?v=<version>` for the current version is cacheable for a
+year, anything else is revalidated on every use.
+
+Bundles are dropped when an admin updates a language and rebuilt on the next
+request. The update is also published on the broker's `translations` topic so
+every worker drops its copy, and every stored language is reloaded each
+`refresh_interval` in case an announcement was missed.
+"""
+import asyncio
+import gzip
+import hashlib
+import logging
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+from fastjson import dumps
+
+COLLECTION = "site_translations"
+TOPIC = "translations"
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, no-cache"
+
+logger = logging.getLogger(__name__)
+
+
+class Bundle:
+    def __init__(self, doc: dict):
+        self.body = dumps(doc)
+        self.version = hashlib.sha256(self.body).hexdigest()[:16]
+        self.etag = f'"{self.version}"'
+        self.gzipped = gzip.compress(self.body, compresslevel=9, mtime=0)
+        self.gzip_etag = f'"{self.version}-gzip"'
+
+    def response(self, headers: Headers, version: str = None) -> Response:
+        gzipped = "gzip" in headers.get("accept-encoding", "")
+        etag = self.gzip_etag if gzipped else self.etag
+        response_headers = {
+            "etag": etag,
+            "cache-control": IMMUTABLE if version == self.version else REVALIDATE,
+            "vary": "Accept-Encoding",
+        }
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in [
+            tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+        ]):
+            return Response(status_code=304, headers=response_headers)
+        if gzipped:
+            return Response(self.gzipped, media_type="application/json",
+                            headers={**response_headers, "content-encoding": "gzip"})
+        return Response(self.body, media_type="application/json", headers=response_headers)
+
+
+class TranslationBundles:
+    def __init__(self, db, max_bundles: int = 256, refresh_interval: float = 300.0):
+        self.db = db
+        self.max_bundles = max_bundles
+        self.refresh_interval = refresh_interval
+        self._bundles = {}
+        self._generation = 0
+        self._task = None
+        self.hits = 0
+        self.loads = 0
+        self.reloads = 0
+        self.invalidations = 0
+
+    async def _load(self, language_code: str) -> Bundle:
+        doc = await self.db[COLLECTION].find_one({"language_code": language_code}, {"_id": 0})
+        self.loads += 1
+        return Bundle(doc or {"language_code": language_code, "translations": {}})
+
+    async def get(self, language_code: str) -> Bundle:
+        bundle = self._bundles.get(language_code)
+        if bundle is not None:
+            self.hits += 1
+            return bundle
+        generation = self._generation
+        bundle = await self._load(language_code)
+        if generation != self._generation:
+            # Invalidated while loading; the next request reads the update
+            return bundle
+        if len(self._bundles) >= self.max_bundles:
+            # Unknown codes are cached too; evict the oldest entry to stay bounded
+            self._bundles.pop(next(iter(self._bundles)))
+        self._bundles[language_code] = bundle
+        return bundle
+
+    async def warm(self):
+        """Build the bundle of every stored language, reusing the ones that are unchanged."""
+        generation = self._generation
+        bundles = {}
+        async for doc in self.db[COLLECTION].find({}, {"_id": 0}):
+            current = self._bundles.get(doc["language_code"])
+            if current is not None and current.body == dumps(doc):
+                bundles[doc["language_code"]] = current
+                continue
+            bundles[doc["language_code"]] = Bundle(doc)
+            self.loads += 1
+        if generation != self._generation:
+            # Invalidated while loading; the next reload picks the update up
+            return
+        # Codes with no stored translations are dropped and rebuilt on request
+        self._bundles = bundles
+        self.reloads += 1
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.warm()
+            except Exception:
+                logger.exception("Reloading the translation bundles failed")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def invalidate(self, language_code: str):
+        self._generation += 1
+        if self._bundles.pop(language_code, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        return {
+            "bundles": len(self._bundles),
+            "hits": self.hits,
+            "loads": self.loads,
+            "reloads": self.reloads,
+            "invalidations": self.invalidations,
+            "versions": {code: b.version for code, b in self._bundles.items()},
+        }
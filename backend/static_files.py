@@ -0,0 +1,160 @@
+"""
+Static serving for /uploads.
+
+Upload filenames are derived from their content (see uploads.store_image) and
+files are never rewritten, so responses are cached as immutable for a year
+and carry a strong ETag built from the filename. Conditional requests are
+answered with 304 and single byte ranges with 206.
+
+JPEG and PNG requests are answered with the WebP rendition from images.py
+when the client accepts WebP and one exists on disk; those responses vary on
+Accept.
+"""
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+from uploads import original_stem
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+CHUNK_SIZE = 64 * 1024
+
+# Extensions that may be swapped for a WebP rendition
+NEGOTIABLE = {".jpg", ".jpeg", ".png"}
+
+
+def accepts_webp(accept: str) -> bool:
+    for item in accept.split(","):
+        media_type, *params = [p.strip() for p in item.split(";")]
+        if media_type != "image/webp":
+            continue
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def webp_rendition(path: str) -> str:
+    """`<sha>.png` -> `<sha>_full.webp`, `<sha>_small.jpg` -> `<sha>_small.webp`."""
+    directory, name = os.path.split(path)
+    base = os.path.splitext(path)[0]
+    if original_stem(os.path.basename(directory), name) != name.split(".")[0]:
+        return f"{base}.webp"
+    return f"{base}_full.webp"
+
+
+def parse_range(header: str, size: int):
+    """Return (start, end) for a single `bytes=` range, None to serve the whole
+    file, or False when the range can't be satisfied."""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                return False
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+class FileRangeResponse(Response):
+    """206 response streaming bytes start..end (inclusive) of a file."""
+
+    def __init__(self, path: str, start: int, end: int, size: int, headers: dict):
+        headers = {
+            **headers,
+            "content-range": f"bytes {start}-{end}/{size}",
+            "content-length": str(end - start + 1),
+        }
+        super().__init__(status_code=206, headers=headers)
+        self.path = path
+        self.start = start
+        self.end = end
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while remaining > 0:
+                chunk = await file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            # File shrank underneath us; end the body rather than hang the client
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class UploadFiles(StaticFiles):
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if scope["method"] in ("GET", "HEAD") and os.path.splitext(path)[1].lower() in NEGOTIABLE:
+            if accepts_webp(Headers(scope=scope).get("accept", "")):
+                full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, webp_rendition(path))
+                if stat_result is not None:
+                    return self.file_response(full_path, stat_result, scope)
+        return await super().get_response(path, scope)
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        etag = f'"{Path(full_path).name}"'
+        headers = {
+            "etag": etag,
+            "cache-control": CACHE_CONTROL,
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+            "accept-ranges": "bytes",
+        }
+        requested = scope["path"]
+        if os.path.splitext(requested)[1].lower() in NEGOTIABLE:
+            headers["vary"] = "Accept"
+
+        if status_code == 200 and self.is_fresh(request_headers, etag, stat_result.st_mtime):
+            return NotModifiedResponse(Headers(headers))
+
+        range_header = request_headers.get("range")
+        if status_code == 200 and range_header and request_headers.get("if-range", etag) == etag:
+            size = stat_result.st_size
+            byte_range = parse_range(range_header, size)
+            if byte_range is False:
+                return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+            if byte_range is not None:
+                return FileRangeResponse(full_path, *byte_range, size, headers)
+
+        return FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+
+    @staticmethod
+    def is_fresh(request_headers: Headers, etag: str, mtime: float) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
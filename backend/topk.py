@@ -0,0 +1,199 @@
+"""
+In-memory top-K lists behind the most liked, saved and viewed discover tabs.
+
+The K highest quotes per (metric, language) are loaded on first use with one
+indexed query and reloaded every `refresh_interval`, so the first pages of
+/api/discover/{liked,saved,viewed} never touch the database. Counter changes
+this process sees move members in place; when a quote outside a list reaches
+its threshold (the K-th value), or a member drops to the bottom, the list is
+reloaded early. Pages reaching past K, and languages that are not in the
+`languages` collection, fall back to the indexed query.
+
+A deleted user's quotes are removed by a background job some time after the
+route returns, so the ids of deleted users are kept out of reloads and of the
+fallback query for `exclude_seconds` (at most `max_excluded` of them) rather
+than being read straight back in. Deleted quotes are gone before they are
+discarded and need no exclusion.
+"""
+import asyncio
+import logging
+import time
+
+from pagination import encode_cursor
+
+logger = logging.getLogger(__name__)
+
+
+class TopKLists:
+    def __init__(self, db, k: int = 100, refresh_interval: float = 60.0, min_reload_interval: float = 1.0,
+                 max_lists: int = 64, exclude_seconds: float = 3600.0, max_excluded: int = 1000):
+        self.db = db
+        self.k = k
+        self.refresh_interval = refresh_interval
+        self.min_reload_interval = min_reload_interval
+        self.max_lists = max_lists
+        self.exclude_seconds = exclude_seconds
+        self.max_excluded = max_excluded
+        self.lists = {}
+        # Codes in the languages collection, refreshed with the lists
+        self.languages = None
+        # Deleted user id -> monotonic time the exclusion expires, oldest first
+        self._excluded = {}
+        self._locks = {}
+        self._dirty = set()
+        self._wake = asyncio.Event()
+        self._task = None
+        self.hits = 0
+        self.fallbacks = 0
+        self.reloads = 0
+        self.early_reloads = 0
+
+    def exclusion(self) -> dict:
+        """Query clause keeping the quotes of recently deleted users out."""
+        now = time.monotonic()
+        self._excluded = {user_id: expires for user_id, expires in self._excluded.items() if expires > now}
+        return {"user_id": {"$nin": list(self._excluded)}} if self._excluded else {}
+
+    async def _load_languages(self):
+        self.languages = set(await self.db.languages.distinct("code"))
+
+    async def _load(self, key):
+        metric, language = key
+        query = {"language": language} if language else {}
+        query.update(self.exclusion())
+        rows = await self.db.quotes.find(query, {"_id": 0}).sort([(metric, -1), ("id", -1)]).limit(self.k).to_list(self.k)
+        self.lists[key] = rows
+        self.reloads += 1
+
+    async def get(self, metric: str, language: str = None):
+        """The cached list for (metric, language), loading it if needed.
+
+        None for an unknown language or once max_lists are held.
+        """
+        if language is not None:
+            if self.languages is None:
+                await self._load_languages()
+            if language not in self.languages:
+                return None
+        key = (metric, language)
+        if key not in self.lists:
+            if len(self.lists) >= self.max_lists:
+                return None
+            async with self._locks.setdefault(key, asyncio.Lock()):
+                if key not in self.lists:
+                    await self._load(key)
+        return self.lists[key]
+
+    async def page(self, metric: str, language: str, skip: int, limit: int):
+        """Return (rows, next_cursor) from memory, or None if the page reaches past the list."""
+        rows = await self.get(metric, language)
+        end = skip + limit
+        if rows is None or (end > len(rows) and len(rows) == self.k):
+            self.fallbacks += 1
+            return None
+        self.hits += 1
+        # A full list may have more quotes beyond it; a short one holds them all
+        more = end < len(rows) or (end == len(rows) == self.k)
+        return rows[skip:end], encode_cursor(rows[end - 1], metric) if more and limit > 0 else None
+
+    def _mark(self, key):
+        self._dirty.add(key)
+        self._wake.set()
+
+    def observe(self, metric: str, quote_id: str, language: str, delta: int, value: int = None):
+        """Apply a counter change to the lists holding (or that should hold) the quote.
+
+        `value` is the counter after the change, when known; without it a quote
+        outside a list is left for the next scheduled reload.
+        """
+        for key in {(metric, None), (metric, language)}:
+            rows = self.lists.get(key)
+            if rows is None:
+                continue
+            member = next((r for r in rows if r["id"] == quote_id), None)
+            full = len(rows) == self.k
+            if member is not None:
+                member[metric] = member.get(metric, 0) + delta
+                rows.sort(key=lambda r: (r.get(metric, 0), r["id"]), reverse=True)
+                # Something outside the list may outrank it now
+                if full and delta < 0 and rows[-1] is member:
+                    self._mark(key)
+            elif not full or (value is not None and value >= rows[-1].get(metric, 0)):
+                self._mark(key)
+
+    def observe_views(self, views: dict, languages: dict):
+        """ViewCounter flush hook: `views` maps quote ids to flushed view increments."""
+        for quote_id, n in views.items():
+            self.observe("views_count", quote_id, languages.get(quote_id), n)
+
+    def discard(self, quote_id: str = None, user_id: str = None):
+        """Drop a deleted quote, or every quote of a deleted user, and refill the lists."""
+        if user_id is not None:
+            self._excluded.pop(user_id, None)
+            self._excluded[user_id] = time.monotonic() + self.exclude_seconds
+            while len(self._excluded) > self.max_excluded:
+                self._excluded.pop(next(iter(self._excluded)))
+        for key, rows in self.lists.items():
+            kept = [r for r in rows if r["id"] != quote_id and (user_id is None or r.get("user_id") != user_id)]
+            if len(kept) != len(rows):
+                self.lists[key] = kept
+                self._mark(key)
+
+    async def _reload(self, keys):
+        for key in keys:
+            try:
+                await self._load(key)
+            except Exception:
+                logger.exception("Reloading top-K list %s failed", key)
+
+    async def _run(self):
+        last_full = time.monotonic()
+        while True:
+            timeout = max(last_full + self.refresh_interval - time.monotonic(), 0)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if time.monotonic() - last_full >= self.refresh_interval:
+                self._dirty.clear()
+                try:
+                    await self._load_languages()
+                    # Lists of languages that were removed are dropped rather than refreshed
+                    self.lists = {key: rows for key, rows in self.lists.items()
+                                  if key[1] is None or key[1] in self.languages}
+                except Exception:
+                    logger.exception("Reloading the known languages failed")
+                await self._reload(list(self.lists))
+                last_full = time.monotonic()
+            elif self._dirty:
+                keys, self._dirty = self._dirty, set()
+                self.early_reloads += len(keys)
+                await self._reload(keys)
+            # Coalesce bursts of threshold crossings into one reload
+            await asyncio.sleep(self.min_reload_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "lists": len(self.lists),
+            "k": self.k,
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "reloads": self.reloads,
+            "early_reloads": self.early_reloads,
+            "pending_reloads": len(self._dirty),
+            "excluded": len(self._excluded),
+        }
@@ -0,0 +1,222 @@
+"""
+Time-decayed trending scores backing /api/discover/trending and the homepage.
+
+Every view, like and save adds its weight to the quote's score in the
+`trending` collection, scaled by 2^((t - epoch) / half-life) where t is the
+time of the event. Because older events carry exponentially smaller
+increments, the stored scores rank quotes exactly as if every event decayed
+with the given half-life, yet each event is a single $inc and trending is an
+indexed read of the top scores.
+
+The scale grows with time, so the epoch moves forward every REBASE_EVERY and
+`maintain` rescales the scores stored against an older epoch; an event that
+finds its quote still on an old epoch rescales that one document itself.
+`maintain` also drops quotes whose score has decayed to nothing. Until it has
+run after a rollover, reads also take the previous epoch's top scores,
+rescaled, so trending isn't emptied at every rebase. Rebuild
+every score from the quote counters (e.g. after changing the weights or the
+half-life), or run the maintenance pass by hand, with:
+
+    python trending.py [rebuild|maintain]
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+COLLECTION = "trending"
+
+HALF_LIFE = timedelta(hours=24)
+
+# Epochs are fixed boundaries, so every process agrees on the current one
+EPOCH_ORIGIN = datetime(2024, 1, 1, tzinfo=timezone.utc)
+REBASE_EVERY = timedelta(days=7)
+
+# Score weights: a new quote gets a head start so fresh quotes surface before engagement
+NEW_QUOTE_WEIGHT = 2
+VIEW_WEIGHT = 1
+LIKE_WEIGHT = 5
+SAVE_WEIGHT = 8
+
+# Quotes whose decayed score falls below this are removed by `maintain`
+PRUNE_BELOW = 0.05
+
+# How far back `rebuild` looks; older quotes would be pruned anyway
+REBUILD_WINDOW = 14 * HALF_LIFE
+
+
+def current_epoch(now: datetime = None) -> datetime:
+    now = now or datetime.now(timezone.utc)
+    periods = (now - EPOCH_ORIGIN) // REBASE_EVERY
+    return EPOCH_ORIGIN + periods * REBASE_EVERY
+
+
+def scale(at: datetime, epoch: datetime) -> float:
+    return 2 ** ((at - epoch) / HALF_LIFE)
+
+
+async def record(db, quote_id: str, language: str, weight: float, at: datetime = None):
+    await record_many(db, [(quote_id, language, weight)], at)
+
+
+async def record_many(db, events: list, at: datetime = None):
+    """Apply (quote_id, language, weight) events that happened at `at` (now by default)."""
+    events = [e for e in events if e[2]]
+    if not events:
+        return
+    # A past event is scaled by its own time but still stored against the current epoch
+    epoch = current_epoch()
+    factor = scale(at or datetime.now(timezone.utc), epoch)
+    try:
+        await db[COLLECTION].bulk_write([
+            UpdateOne(
+                {"quote_id": quote_id, "epoch": epoch},
+                {"$inc": {"score": weight * factor}, "$setOnInsert": {"language": language}},
+                upsert=True
+            )
+            for quote_id, language, weight in events
+        ], ordered=False)
+    except BulkWriteError as e:
+        # A duplicate key means the quote's score is still on an older epoch
+        for error in e.details["writeErrors"]:
+            if error["code"] != 11000:
+                raise
+            quote_id, language, weight = events[error["index"]]
+            await _rebase_and_apply(db, quote_id, language, weight * factor, epoch)
+
+
+async def _rebase_and_apply(db, quote_id: str, language: str, amount: float, epoch: datetime):
+    for _ in range(5):
+        doc = await db[COLLECTION].find_one({"quote_id": quote_id}, {"_id": 0})
+        if doc is None:
+            try:
+                await db[COLLECTION].insert_one({"quote_id": quote_id, "language": language, "epoch": epoch, "score": amount})
+                return
+            except DuplicateKeyError:
+                continue
+        if doc["epoch"] == epoch:
+            result = await db[COLLECTION].update_one({"quote_id": quote_id, "epoch": epoch}, {"$inc": {"score": amount}})
+        else:
+            rescaled = doc["score"] * scale(doc["epoch"], epoch)
+            result = await db[COLLECTION].update_one(
+                {"quote_id": quote_id, "epoch": doc["epoch"], "score": doc["score"]},
+                {"$set": {"epoch": epoch, "score": rescaled + amount}}
+            )
+        if result.matched_count:
+            return
+
+
+async def remove_quotes(db, quote_ids: list):
+    await db[COLLECTION].delete_many({"quote_id": {"$in": quote_ids}})
+
+
+async def top_ids(db, language: str = None, limit: int = 5) -> list:
+    epoch = current_epoch()
+    scores = {}
+    # Scores left on the previous epoch by a pending rebase are rescaled here
+    for stored_epoch in (epoch, epoch - REBASE_EVERY):
+        query = {"epoch": stored_epoch}
+        if language:
+            query["language"] = language
+        rows = await db[COLLECTION].find(query, {"_id": 0, "quote_id": 1, "score": 1}) \
+            .sort("score", -1).limit(limit).to_list(limit)
+        factor = scale(stored_epoch, epoch)
+        for r in rows:
+            scores[r["quote_id"]] = r["score"] * factor
+    return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+
+async def top_quotes(db, language: str = None, limit: int = 5) -> list:
+    """The `limit` hottest quotes, optionally in one language, hottest first."""
+    ids = await top_ids(db, language, limit)
+    quotes = await db.quotes.find({"id": {"$in": ids}}, {"_id": 0}).to_list(len(ids))
+    by_id = {q["id"]: q for q in quotes}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+async def maintain(db, batch_size: int = 1000) -> dict:
+    """Move scores on older epochs to the current one and drop decayed quotes."""
+    now = datetime.now(timezone.utc)
+    epoch = current_epoch(now)
+    rebased = 0
+    while True:
+        docs = await db[COLLECTION].find(
+            {"epoch": {"$lt": epoch}}, {"_id": 0, "quote_id": 1, "epoch": 1, "score": 1}
+        ).limit(batch_size).to_list(batch_size)
+        if not docs:
+            break
+        # Conditional on the old values; a concurrent event rebases the document itself
+        await db[COLLECTION].bulk_write([
+            UpdateOne(
+                {"quote_id": d["quote_id"], "epoch": d["epoch"], "score": d["score"]},
+                {"$set": {"epoch": epoch, "score": d["score"] * scale(d["epoch"], epoch)}}
+            )
+            for d in docs
+        ], ordered=False)
+        rebased += len(docs)
+
+    result = await db[COLLECTION].delete_many({"epoch": epoch, "score": {"$lt": PRUNE_BELOW * scale(now, epoch)}})
+    return {"epoch": epoch, "rebased": rebased, "pruned": result.deleted_count}
+
+
+async def maintenance_job(db, job: dict, progress):
+    result = await maintain(db)
+    await progress(**result)
+
+
+async def rebuild(db) -> int:
+    """Recompute scores from quote counters, treating engagement as happening at creation."""
+    now = datetime.now(timezone.utc)
+    epoch = current_epoch(now)
+    await db[COLLECTION].delete_many({})
+    total = 0
+    batch = []
+    async for q in db.quotes.find(
+        {"created_at": {"$gte": now - REBUILD_WINDOW}},
+        {"_id": 0, "id": 1, "language": 1, "created_at": 1, "views_count": 1, "likes_count": 1, "saves_count": 1}
+    ):
+        weight = (
+            NEW_QUOTE_WEIGHT
+            + VIEW_WEIGHT * q.get("views_count", 0)
+            + LIKE_WEIGHT * q.get("likes_count", 0)
+            + SAVE_WEIGHT * q.get("saves_count", 0)
+        )
+        batch.append({"quote_id": q["id"], "language": q.get("language"), "epoch": epoch,
+                      "score": weight * scale(q["created_at"], epoch)})
+        if len(batch) >= 1000:
+            await db[COLLECTION].insert_many(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        await db[COLLECTION].insert_many(batch)
+        total += len(batch)
+    return total
+
+
+async def main(command: str):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from indexes import ensure_indexes
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+
+    if command == "rebuild":
+        await ensure_indexes(db)
+        total = await rebuild(db)
+        print(f"Scored {total} quotes")
+    elif command == "maintain":
+        result = await maintain(db)
+        print(f"Rebased {result['rebased']} scores to {result['epoch']:%Y-%m-%d}, pruned {result['pruned']}")
+    else:
+        print(f"Unknown command: {command}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "rebuild"))
@@ -0,0 +1,219 @@
+"""
+Materialized per-user unread counters for messages and notifications.
+
+One document per user in `unread_counters`, incremented when a message or
+notification is created for them and decremented when they read it, so badge
+polling is a single indexed lookup.
+
+Broadcast badges keep a single watermark per user, `broadcasts_through`: every
+broadcast created up to then is included in the count unless it was read before
+fan-out reached the user. Fan-out moves the watermark forward with a
+conditional update, counting everything between the old and the new watermark,
+so a retried or out-of-order batch never counts a broadcast twice. Reading a
+broadcast takes back an increment only if the watermark already covers it,
+and bumps `broadcasts_version` so a fan-out racing with the read recounts
+instead of counting it.
+Rebuild every counter from the
+conversations, notifications and broadcasts collections with:
+
+    python unread.py reconcile
+"""
+import asyncio
+import logging
+import os
+import sys
+from bisect import bisect_right
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "unread_counters"
+FIELDS = ("messages", "notifications")
+
+
+async def increment(db, user_id: str, field: str, amount: int = 1):
+    await db[COLLECTION].update_one({"user_id": user_id}, {"$inc": {field: amount}}, upsert=True)
+
+
+async def decrement(db, user_id: str, field: str, amount: int = 1):
+    if amount <= 0:
+        return
+    result = await db[COLLECTION].update_one(
+        {"user_id": user_id, field: {"$gte": amount}},
+        {"$inc": {field: -amount}}
+    )
+    # A counter that has drifted below the amount read is clamped rather than going negative
+    if result.matched_count == 0:
+        await db[COLLECTION].update_one({"user_id": user_id}, {"$set": {field: 0}})
+
+
+async def count_broadcasts(db, users: list, through, attempts: int = 5):
+    """Fan-out: count the unread broadcasts created up to `through` for `users` ({id, created_at})."""
+    pending = {u["id"]: u["created_at"] for u in users}
+    for _ in range(attempts):
+        if not pending:
+            return
+        docs = {d["user_id"]: d async for d in db[COLLECTION].find(
+            {"user_id": {"$in": list(pending)}},
+            {"_id": 0, "user_id": 1, "broadcasts_through": 1, "broadcasts_version": 1}
+        )}
+        since = {}
+        for uid, registered_at in pending.items():
+            counted = docs.get(uid, {}).get("broadcasts_through")
+            if counted is None or counted < through:
+                since[uid] = max(registered_at, counted) if counted is not None else registered_at
+        if not since:
+            return
+        window = await db.broadcasts.find(
+            {"created_at": {"$gt": min(since.values()), "$lte": through}}, {"_id": 0, "id": 1, "created_at": 1}
+        ).to_list(None)
+        read = {(r["user_id"], r["broadcast_id"]) async for r in db.broadcast_reads.find(
+            {"user_id": {"$in": list(since)}, "broadcast_id": {"$in": [b["id"] for b in window]}, "read": True},
+            {"_id": 0, "user_id": 1, "broadcast_id": 1}
+        )}
+
+        ops = []
+        for uid, start in since.items():
+            count = sum(1 for b in window if b["created_at"] > start and (uid, b["id"]) not in read)
+            doc = docs.get(uid, {})
+            # Applies only if no other fan-out or read touched the user since it was read above
+            ops.append(UpdateOne(
+                {
+                    "user_id": uid,
+                    "broadcasts_through": doc.get("broadcasts_through", {"$exists": False}),
+                    "broadcasts_version": doc.get("broadcasts_version", {"$exists": False}),
+                },
+                {"$inc": {"notifications": count}, "$set": {"broadcasts_through": through}},
+                upsert=True
+            ))
+        try:
+            await db[COLLECTION].bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            # An upsert that lost the race collides on user_id and is retried below
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+        pending = {uid: pending[uid] for uid in since}
+    if pending:
+        logger.warning("Broadcast count for %d users kept conflicting; reconcile will repair them", len(pending))
+
+
+async def settle_broadcasts(db, user_id: str, created: list, attempts: int = 5) -> int:
+    """Take back the badge of newly read broadcasts created at `created`; returns how many were counted."""
+    if not created:
+        return 0
+    for _ in range(attempts):
+        doc = await db[COLLECTION].find_one({"user_id": user_id}, {"_id": 0, "broadcasts_through": 1}) or {}
+        counted = doc.get("broadcasts_through")
+        settled = sum(1 for created_at in created if counted is not None and created_at <= counted)
+        try:
+            # The version bump makes a fan-out that read the user before this recount
+            await db[COLLECTION].update_one(
+                {"user_id": user_id, "broadcasts_through": counted if counted is not None else {"$exists": False}},
+                {"$inc": {"notifications": -settled, "broadcasts_version": 1}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Counted in between
+            continue
+        if settled:
+            # A drifted counter is clamped rather than left negative
+            await db[COLLECTION].update_one({"user_id": user_id, "notifications": {"$lt": 0}}, {"$set": {"notifications": 0}})
+        return settled
+    logger.warning("Settling broadcasts for %s kept conflicting; reconcile will repair the badge", user_id)
+    return 0
+
+
+async def get_counts(db, user_id: str) -> dict:
+    doc = await db[COLLECTION].find_one({"user_id": user_id}, {"_id": 0}) or {}
+    return {field: max(doc.get(field, 0), 0) for field in FIELDS}
+
+
+async def remove_user(db, user_id: str):
+    await db[COLLECTION].delete_many({"user_id": user_id})
+
+
+async def source_counts(db, broadcasts_through=None) -> dict:
+    """Expected counters, with the broadcasts created up to `broadcasts_through`."""
+    counts = {}
+    async for conversation in db.conversations.find({}, {"_id": 0, "unread": 1}):
+        for uid, count in (conversation.get("unread") or {}).items():
+            if count:
+                counts.setdefault(uid, {}).setdefault("messages", 0)
+                counts[uid]["messages"] += count
+    async for row in db.notifications.aggregate([
+        {"$match": {"read": False}},
+        {"$group": {"_id": "$user_id", "count": {"$sum": 1}}}
+    ], allowDiskUse=True):
+        counts.setdefault(row["_id"], {})["notifications"] = row["count"]
+
+    # Broadcasts count for every user registered before them, until read
+    if broadcasts_through is None:
+        return counts
+    broadcast_list = await db.broadcasts.find(
+        {"created_at": {"$lte": broadcasts_through}}, {"_id": 0, "id": 1, "created_at": 1}
+    ).to_list(None)
+    broadcast_times = sorted(b["created_at"] for b in broadcast_list)
+    read = {}
+    async for row in db.broadcast_reads.aggregate([
+        {"$match": {"read": True, "broadcast_id": {"$in": [b["id"] for b in broadcast_list]}}},
+        {"$group": {"_id": "$user_id", "count": {"$sum": 1}}}
+    ], allowDiskUse=True):
+        read[row["_id"]] = row["count"]
+    async for user in db.users.find({}, {"_id": 0, "id": 1, "created_at": 1}):
+        pending = len(broadcast_times) - bisect_right(broadcast_times, user["created_at"]) - read.get(user["id"], 0)
+        if pending > 0:
+            entry = counts.setdefault(user["id"], {})
+            entry["notifications"] = entry.get("notifications", 0) + pending
+    return counts
+
+
+async def reconcile(db, batch_size: int = 1000):
+    """Rewrite every counter that differs from the source data; returns how many were corrected."""
+    latest = await db.broadcasts.find_one({}, {"_id": 0, "created_at": 1}, sort=[("created_at", -1)])
+    through = latest["created_at"] if latest else None
+    expected = await source_counts(db, through)
+    # Counted broadcasts move the watermark, so fan-out doesn't count them again
+    watermark = {"broadcasts_through": through} if through is not None else {}
+    ops = []
+    async for doc in db[COLLECTION].find({}, {"_id": 0}):
+        want = expected.pop(doc["user_id"], {})
+        values = {**{field: want.get(field, 0) for field in FIELDS}, **watermark}
+        if any(doc.get(field, 0) != values[field] for field in FIELDS) \
+                or doc.get("broadcasts_through") != through or "broadcasts" in doc:
+            # `broadcasts` is the per-broadcast map the watermark replaced
+            ops.append(UpdateOne({"user_id": doc["user_id"]}, {"$set": values, "$unset": {"broadcasts": ""}}))
+    for uid, want in expected.items():
+        ops.append(UpdateOne(
+            {"user_id": uid},
+            {"$set": {**{field: want.get(field, 0) for field in FIELDS}, **watermark}},
+            upsert=True
+        ))
+
+    for i in range(0, len(ops), batch_size):
+        await db[COLLECTION].bulk_write(ops[i:i + batch_size], ordered=False)
+    return len(ops)
+
+
+async def main(command: str):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from indexes import ensure_indexes
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+
+    if command == "reconcile":
+        await ensure_indexes(db)
+        corrected = await reconcile(db)
+        print(f"Corrected {corrected} unread counters")
+    else:
+        print(f"Unknown command: {command}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "reconcile"))
@@ -0,0 +1,221 @@
+"""
+Upload storage.
+
+Uploaded images are streamed to disk in chunks, never held in memory whole,
+and rejected once they pass the size cap (UPLOAD_MAX_BYTES). Multipart request
+bodies are capped while they are received by `UploadSizeLimit`, before Starlette
+spools them, so an oversized upload is refused without being read in full. The format is taken from the
+file's magic bytes rather than the client's name or content type. Files are
+named after the SHA-256 of their content, so uploading the same image twice
+stores it once.
+
+Files no longer referenced by any document (replaced avatars, deleted
+backgrounds, blog images that were never used) are removed with:
+
+    python uploads.py gc [--dry-run]
+"""
+import asyncio
+import hashlib
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import aiofiles
+from dotenv import load_dotenv
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+UPLOAD_DIR = Path(__file__).parent / 'uploads'
+SUBDIRS = ("avatars", "backgrounds", "blogs")
+
+CHUNK_SIZE = 64 * 1024
+
+# Room for the multipart boundaries, part headers and small form fields around the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadSizeLimit:
+    """ASGI middleware refusing multipart bodies larger than `max_bytes` plus the multipart overhead."""
+
+    def __init__(self, app: ASGIApp, max_bytes: int):
+        self.app = app
+        self.limit = max_bytes + MULTIPART_OVERHEAD
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if not headers.get("content-type", "").startswith("multipart/"):
+            await self.app(scope, receive, send)
+            return
+        detail = f"Upload exceeds {self.limit - MULTIPART_OVERHEAD} bytes"
+        length = headers.get("content-length", "")
+        if length.isdigit() and int(length) > self.limit:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.limit:
+                    # Raised while the form is parsed, so the app answers it like any other HTTPException
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def sniff_image_type(head: bytes):
+    """Return the file extension for the image format in `head`, or None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+async def store_image(file: UploadFile, subdir: str, max_bytes: int) -> str:
+    """Stream an uploaded image into uploads/<subdir>; returns its public URL."""
+    directory = UPLOAD_DIR / subdir
+    tmp_path = directory / f".tmp-{uuid.uuid4().hex}"
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    try:
+        async with aiofiles.open(tmp_path, 'wb') as out:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File exceeds {max_bytes} bytes")
+                if len(head) < 12:
+                    head += chunk[:12 - len(head)]
+                digest.update(chunk)
+                await out.write(chunk)
+
+        ext = sniff_image_type(head)
+        if ext is None:
+            raise HTTPException(status_code=400, detail="File must be a JPEG, PNG, GIF or WebP image")
+
+        filename = f"{digest.hexdigest()}.{ext}"
+        final_path = directory / filename
+        if final_path.exists():
+            tmp_path.unlink()
+            # Refresh the age so a concurrent GC run doesn't collect it before it's referenced again
+            os.utime(final_path)
+        else:
+            os.replace(tmp_path, final_path)
+        return f"/uploads/{subdir}/{filename}"
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def _variant_urls(variants) -> list:
+    return [url for entry in (variants or {}).values() for url in entry.values() if isinstance(url, str)]
+
+
+async def referenced_urls(db) -> set:
+    urls = set()
+    async for user in db.users.find({"avatar": {"$regex": "^/uploads/"}}, {"_id": 0, "avatar": 1, "avatar_variants": 1}):
+        urls.add(user["avatar"])
+        urls.update(_variant_urls(user.get("avatar_variants")))
+    async for bg in db.backgrounds.find({}, {"_id": 0, "url": 1, "variants": 1}):
+        urls.add(bg.get("url"))
+        urls.update(_variant_urls(bg.get("variants")))
+    async for blog in db.blogs.find(
+        {"featured_image": {"$regex": "^/uploads/"}}, {"_id": 0, "featured_image": 1, "featured_image_variants": 1}
+    ):
+        urls.add(blog["featured_image"])
+        urls.update(_variant_urls(blog.get("featured_image_variants")))
+    return urls
+
+
+def original_stem(subdir: str, name: str) -> str:
+    """The stem of the original a file belongs to: `<stem>_<variant>.<ext>` maps to `<stem>`."""
+    from images import VARIANTS
+
+    stem = name.split(".")[0]
+    # Only a known variant suffix is stripped; older upload names contain underscores themselves
+    base, _, suffix = stem.rpartition("_")
+    if base and suffix in VARIANTS.get(subdir, {}):
+        return base
+    return stem
+
+
+async def collect_garbage(db, dry_run: bool = False, min_age: float = None) -> dict:
+    """Delete upload files that no document references; returns counts and bytes freed."""
+    # Younger files are never collected: the document referencing them may not be written yet
+    if min_age is None:
+        min_age = float(os.environ.get('UPLOAD_GC_MIN_AGE', 24 * 3600))
+    referenced = await referenced_urls(db)
+    referenced_stems = set()
+    for url in referenced:
+        if url and url.startswith("/uploads/"):
+            subdir, _, name = url[len("/uploads/"):].partition("/")
+            referenced_stems.add((subdir, name.split(".")[0]))
+    cutoff = time.time() - min_age
+    removed = 0
+    freed = 0
+    kept = 0
+    for subdir in SUBDIRS:
+        directory = UPLOAD_DIR / subdir
+        if not directory.is_dir():
+            continue
+        for path in directory.iterdir():
+            if not path.is_file():
+                continue
+            # Resized variants live as long as their original, recorded on the document or not
+            if f"/uploads/{subdir}/{path.name}" in referenced or (subdir, original_stem(subdir, path.name)) in referenced_stems:
+                kept += 1
+                continue
+            stat = path.stat()
+            if stat.st_mtime > cutoff:
+                kept += 1
+                continue
+            removed += 1
+            freed += stat.st_size
+            if not dry_run:
+                path.unlink(missing_ok=True)
+    return {"removed": removed, "bytes_freed": freed, "kept": kept, "dry_run": dry_run}
+
+
+async def gc_job(db, job: dict, progress):
+    result = await collect_garbage(db)
+    await progress(**result)
+
+
+async def main(args: list):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+
+    command = args[0] if args else "gc"
+    if command == "gc":
+        result = await collect_garbage(db, dry_run="--dry-run" in args)
+        verb = "Would remove" if result["dry_run"] else "Removed"
+        print(f"{verb} {result['removed']} files ({result['bytes_freed']} bytes), kept {result['kept']}")
+    else:
+        print(f"Unknown command: {command}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,157 @@
+"""
+Write-behind buffer for quote view counts.
+
+GET /api/quotes/{id} only bumps an in-memory counter; increments are coalesced
+per quote and flushed periodically (or when too many quotes are pending) as
+one unordered bulk_write, together with the matching leaderboard buckets and
+trending scores.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+import leaderboard
+import trending
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    def __init__(self, db, flush_interval: float = 5.0, max_keys: int = 10000, on_flush=None):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_keys = max_keys
+        # Called with the flushed {quote_id: views} and {quote_id: language} after each flush
+        self.on_flush = on_flush
+        self._views = Counter()
+        self._buckets = Counter()
+        self._languages = {}
+        self._oldest_pending = None
+        self._wake = asyncio.Event()
+        self._task = None
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+        self.views_flushed = 0
+        self.failed_flushes = 0
+        self.last_flush_keys = 0
+        self.max_flush_keys = 0
+        self.last_flush_seconds = 0.0
+        self.last_flush_lag_seconds = 0.0
+        self.max_flush_lag_seconds = 0.0
+
+    def add(self, quote: dict):
+        if self._oldest_pending is None:
+            self._oldest_pending = time.monotonic()
+        self._views[quote['id']] += 1
+        self._languages[quote['id']] = quote.get('language')
+        self._buckets[(quote['user_id'], leaderboard.bucket_day(quote['created_at']))] += 1
+        if len(self._views) >= self.max_keys:
+            self._wake.set()
+
+    async def _write(self, collection: str, increments: Counter, make_update) -> Counter:
+        """Apply one update per increment; returns the increments that were not written."""
+        if not increments:
+            return Counter()
+        items = list(increments.items())
+        try:
+            await self.db[collection].bulk_write([make_update(key, n) for key, n in items], ordered=False)
+        except BulkWriteError as e:
+            # Unordered: everything but the reported writes went through
+            logger.error("View count flush to %s failed for %d of %d updates",
+                         collection, len(e.details["writeErrors"]), len(items))
+            return Counter(dict(items[error["index"]] for error in e.details["writeErrors"]))
+        except Exception:
+            logger.exception("View count flush to %s failed", collection)
+            return increments
+        return Counter()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._views and not self._buckets:
+                return
+            views, buckets, languages, oldest = self._views, self._buckets, self._languages, self._oldest_pending
+            self._views, self._buckets, self._languages, self._oldest_pending = Counter(), Counter(), {}, None
+
+            started = time.monotonic()
+            # The two collections are written independently, so a part that went through is never retried
+            failed_views = await self._write(
+                "quotes", views, lambda quote_id, n: UpdateOne({"id": quote_id}, {"$inc": {"views_count": n}})
+            )
+            failed_buckets = await self._write(
+                leaderboard.COLLECTION, buckets, lambda key, n: leaderboard.bucket_update(key[0], key[1], views=n)
+            )
+            if failed_views or failed_buckets:
+                # Put the unwritten increments back so the next flush retries them
+                self.failed_flushes += 1
+                self._views.update(failed_views)
+                self._buckets.update(failed_buckets)
+                self._languages.update({quote_id: languages.get(quote_id) for quote_id in failed_views})
+                self._oldest_pending = min(oldest, self._oldest_pending or oldest)
+                views = Counter({quote_id: n for quote_id, n in views.items() if quote_id not in failed_views})
+                if not views:
+                    return
+
+            # Scores are approximate anyway, so a failed trending update is not retried
+            try:
+                await trending.record_many(
+                    self.db, [(quote_id, languages.get(quote_id), n * trending.VIEW_WEIGHT) for quote_id, n in views.items()]
+                )
+            except Exception:
+                logger.exception("Trending score update failed")
+            if self.on_flush is not None:
+                self.on_flush(views, languages)
+
+            finished = time.monotonic()
+            self.flushes += 1
+            self.views_flushed += sum(views.values())
+            self.last_flush_keys = len(views)
+            self.max_flush_keys = max(self.max_flush_keys, len(views))
+            self.last_flush_seconds = finished - started
+            self.last_flush_lag_seconds = finished - oldest
+            self.max_flush_lag_seconds = max(self.max_flush_lag_seconds, self.last_flush_lag_seconds)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            # Cancelled only between flushes, so a batch already swapped out is never dropped
+            async with self._flush_lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending_keys": len(self._views),
+            "pending_views": sum(self._views.values()),
+            "pending_lag_seconds": round(time.monotonic() - self._oldest_pending, 3) if self._oldest_pending else 0.0,
+            "flush_interval": self.flush_interval,
+            "max_keys": self.max_keys,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "views_flushed": self.views_flushed,
+            "last_flush_keys": self.last_flush_keys,
+            "max_flush_keys": self.max_flush_keys,
+            "last_flush_seconds": round(self.last_flush_seconds, 6),
+            "last_flush_lag_seconds": round(self.last_flush_lag_seconds, 3),
+            "max_flush_lag_seconds": round(self.max_flush_lag_seconds, 3),
+        }